@@ -1,111 +1,226 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, has_request_context, Response, send_from_directory
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from flask_socketio import SocketIO, emit
-from pymongo import MongoClient
+from flask_socketio import SocketIO, emit, join_room
+from pymongo import MongoClient, ReturnDocument, UpdateOne, monitoring
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure, PyMongoError
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import os
+import sys
 from dotenv import load_dotenv
-from bson import ObjectId
+from bson import ObjectId, Binary
 import random
+import math
+import secrets
 import threading
 import time
 import uuid
 import json
+import zlib
+from urllib.parse import quote
+import msgpack
+import hashlib
+import mimetypes
 import redis
+import click
 from functools import wraps
+from collections import Counter
+from flask.sessions import SessionInterface
 from flask_session import Session
+from flask_session.sessions import FileSystemSessionInterface
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash
+from werkzeug.utils import safe_join
+from werkzeug.local import LocalProxy
+
+# Used to measure worker boot and time-to-first-request
+BOOT_STARTED = time.perf_counter()
 
 # Load environment variables
 load_dotenv()
 
-# Access the variables
-SECRET_KEY = os.getenv('SECRET_KEY')
-REDIS_HOST = os.getenv('REDIS_HOST')
-REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))  # Default to 6379 if not set
-REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
-MONGO_URI = os.getenv('MONGO_URI')
-
-# Flask setup with optimized settings
+class Config:
+    DEBUG = False
+    ENV = 'production'
+    SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key')
+    SESSION_TYPE = 'filesystem'  # Switched to Redis in create_app() when Redis is configured
+    SESSION_COOKIE_SECURE = True  # Only send cookies over HTTPS
+    SESSION_COOKIE_HTTPONLY = True  # Prevent JavaScript access to session cookie
+    SESSION_COOKIE_SAMESITE = 'Lax'  # CSRF protection
+    SESSION_REFRESH_EACH_REQUEST = False  # Reduce session writes
+    PERMANENT_SESSION_LIFETIME = timedelta(days=1)  # Limit session lifetime
+    JSON_SORT_KEYS = False  # Reduce CPU usage on JSON responses
+    MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # Limit upload size to 5MB
+
+    MONGO_URI = os.getenv('MONGO_URI')
+    MONGO_DB = os.getenv('MONGO_DB', 'wheel_game')
+    # History and dashboard reads may go to secondaries that lag by at most this
+    # much (MongoDB requires at least 90 seconds); balances and joins always use the primary
+    MONGO_READ_FROM_SECONDARIES = os.getenv('MONGO_READ_FROM_SECONDARIES', 'true').lower() == 'true'
+    MONGO_MAX_STALENESS_SECONDS = max(int(os.getenv('MONGO_MAX_STALENESS_SECONDS', 120)), 90)
+    REDIS_HOST = os.getenv('REDIS_HOST')
+    REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))  # Default to 6379 if not set
+    REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
+    REDIS_DB = int(os.getenv('REDIS_DB', 0))
+    # Defaults to the Redis instance above when not set explicitly
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_LOGGER = os.getenv('SOCKETIO_LOGGER', 'false').lower() == 'true'
+    # Clients that ask for it at connect get round broadcasts msgpack-packed
+    SOCKETIO_PACKED_EVENTS = os.getenv('SOCKETIO_PACKED_EVENTS', 'false').lower() == 'true'
+
+    # Retention: round state in game_history expires, old games are rolled up per day
+    GAME_HISTORY_TTL_DAYS = int(os.getenv('GAME_HISTORY_TTL_DAYS', 7))
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+    ARCHIVE_INTERVAL_SECONDS = int(os.getenv('ARCHIVE_INTERVAL_SECONDS', 3600))
+
+    # Opt-in per-endpoint / per-event timing; the sampling profiler is started from the admin API
+    INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'false').lower() == 'true'
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_INTERVAL_MS = int(os.getenv('PROFILE_INTERVAL_MS', 10))
+    PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 120))
+
+    # Joins are collected for this long and applied with one bulk wallet write
+    JOIN_BATCH_WINDOW_MS = int(os.getenv('JOIN_BATCH_WINDOW_MS', 25))
+
+    # Fingerprinted assets written by build_assets.py; set the prefix to serve them from a CDN
+    ASSET_MANIFEST = os.getenv('ASSET_MANIFEST', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              'static', 'dist', 'manifest.json'))
+    ASSET_URL_PREFIX = os.getenv('ASSET_URL_PREFIX', '').rstrip('/')
+
+# Flask setup. Importing this module performs no I/O: connections are opened
+# lazily on first use, so each worker creates its own after fork.
 app = Flask(__name__)
-app.config.update(
-    DEBUG=False,
-    ENV='production',
-    SECRET_KEY=os.getenv('SECRET_KEY', 'your-secret-key'),
-    SESSION_TYPE='filesystem',  # Fallback to filesystem if Redis is not available
-    SESSION_COOKIE_SECURE=True,  # Only send cookies over HTTPS
-    SESSION_COOKIE_HTTPONLY=True,  # Prevent JavaScript access to session cookie
-    SESSION_COOKIE_SAMESITE='Lax',  # CSRF protection
-    SESSION_REFRESH_EACH_REQUEST=False,  # Reduce session writes
-    PERMANENT_SESSION_LIFETIME=timedelta(days=1),  # Limit session lifetime
-    JSON_SORT_KEYS=False,  # Reduce CPU usage on JSON responses
-    MAX_CONTENT_LENGTH=5 * 1024 * 1024  # Limit upload size to 5MB
-)
-
-# Redis connection with optimized settings
-try:
-    redis_pool = redis.ConnectionPool(
-        host=REDIS_HOST,
-        port=REDIS_PORT,
-        password=REDIS_PASSWORD,
-        max_connections=10,  # Limit max connections
-        socket_timeout=2,
-        socket_connect_timeout=2,
-        retry_on_timeout=True,
-        health_check_interval=30
-    )
-    
-    # Main Redis client for sessions
-    redis_client = redis.Redis(
-        connection_pool=redis_pool,
-        socket_timeout=2,
-        retry_on_timeout=True
-    )
-    redis_client.ping()  # Test connection
-    
-    # Redis clients for specific purposes (using same connection pool)
-    redis_rate_limit = redis.Redis(
-        connection_pool=redis_pool,
-        decode_responses=True
-    )
-    redis_game = redis.Redis(
-        connection_pool=redis_pool,
-        decode_responses=True
-    )
-    
-    app.config['SESSION_TYPE'] = 'redis'
-    app.config['SESSION_REDIS'] = redis_client
-    REDIS_AVAILABLE = True
-    
-except (redis.ConnectionError, redis.RedisError) as e:
-    app.logger.warning(f"Redis not available: {str(e)}. Falling back to filesystem session.")
-    REDIS_AVAILABLE = False
-    redis_client = None
-    redis_rate_limit = None
-    redis_game = None
-
-# Enable CORS
-CORS(app)
-
-# MongoDB setup with optimized connection pooling
-try:
-    mongo_uri = os.getenv('MONGO_URI')
-    client = MongoClient(
-        mongo_uri,
-        maxPoolSize=10,  # Limit max connections
-        minPoolSize=5,   # Maintain minimum connections
-        maxIdleTimeMS=45000,  # Close idle connections after 45s
-        serverSelectionTimeoutMS=5000,  # Fail fast if can't connect
-        connectTimeoutMS=2000,
-        retryWrites=True
-    )
-    db = client['wheel_game']
-    db.command('ping')  # Test connection
-except Exception as e:
-    app.logger.error(f"MongoDB connection failed: {str(e)}")
-    raise
+app.config.from_object(Config)
+
+socketio = SocketIO()
+login_manager = LoginManager()
+login_manager.login_view = 'login'
+server_session = Session()
+
+class Connections:
+    """Per-process MongoDB and Redis handles, created on first use."""
+
+    def __init__(self, redis_retry_interval=30):
+        self.redis_retry_interval = redis_retry_interval
+        self._pid = None
+        self._mongo = None
+        self._read_databases = {}
+        self._redis_pool = None
+        self._redis = None
+        self._redis_ok = None
+        self._redis_checked_at = 0
+
+    def _check_fork(self):
+        # Never reuse sockets inherited from a parent process
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._mongo = None
+            self._read_databases = {}
+            self._redis_pool = None
+            self._redis = None
+            self._redis_ok = None
+
+    def mongo_client(self):
+        self._check_fork()
+        if self._mongo is None:
+            self._mongo = MongoClient(
+                app.config['MONGO_URI'],
+                maxPoolSize=10,  # Limit max connections
+                minPoolSize=5,   # Maintain minimum connections
+                maxIdleTimeMS=45000,  # Close idle connections after 45s
+                serverSelectionTimeoutMS=5000,  # Fail fast if can't connect
+                connectTimeoutMS=2000,
+                retryWrites=True,
+                connect=False,  # Connect on first operation, not at construction
+                event_listeners=[DbCallCounter()] if app.config['INSTRUMENTATION_ENABLED'] else []
+            )
+        return self._mongo
+
+    def database(self):
+        return self.mongo_client()[app.config['MONGO_DB']]
+
+    def use_clients(self, mongo=None, redis_client=None):
+        """Substitute ready-made clients (e.g. in-memory stand-ins for the simulator)."""
+        self._check_fork()
+        if mongo is not None:
+            self._mongo = mongo
+            self._read_databases = {}
+        if redis_client is not None:
+            self._redis = redis_client
+            self._redis_ok = True
+
+    def read_database(self, query_class):
+        client = self.mongo_client()
+        if query_class not in self._read_databases:
+            if query_class in READ_FROM_SECONDARY and app.config['MONGO_READ_FROM_SECONDARIES']:
+                read_preference = SecondaryPreferred(max_staleness=app.config['MONGO_MAX_STALENESS_SECONDS'])
+            else:
+                read_preference = Primary()
+            self._read_databases[query_class] = client.get_database(app.config['MONGO_DB'],
+                                                                    read_preference=read_preference)
+        return self._read_databases[query_class]
+
+    def redis_pool(self):
+        self._check_fork()
+        if self._redis_pool is None:
+            self._redis_pool = redis.ConnectionPool(
+                host=app.config['REDIS_HOST'],
+                port=app.config['REDIS_PORT'],
+                password=app.config['REDIS_PASSWORD'],
+                db=app.config['REDIS_DB'],
+                max_connections=10,  # Limit max connections
+                socket_timeout=2,
+                socket_connect_timeout=2,
+                retry_on_timeout=True,
+                health_check_interval=30
+            )
+        return self._redis_pool
+
+    def redis(self):
+        if self._redis is None or self._pid != os.getpid():
+            self._redis = redis.Redis(connection_pool=self.redis_pool(), socket_timeout=2, retry_on_timeout=True)
+        return self._redis
+
+    def redis_available(self):
+        if not app.config['REDIS_HOST']:
+            return False
+        self._check_fork()
+        now = time.monotonic()
+        if self._redis_ok is None or (not self._redis_ok and now - self._redis_checked_at > self.redis_retry_interval):
+            self._redis_checked_at = now
+            try:
+                self.redis().ping()
+                self._redis_ok = True
+            except (redis.ConnectionError, redis.RedisError) as e:
+                app.logger.warning(f"Redis not available: {str(e)}. Falling back to MongoDB.")
+                self._redis_ok = False
+        return self._redis_ok
+
+# Query classes that tolerate replication lag. Anything else (wallet balance,
+# join checks, settlement) reads from the primary.
+READ_FROM_SECONDARY = {'history', 'dashboard'}
+
+connections = Connections()
+
+def redis_available():
+    return connections.redis_available()
+
+def read_db(query_class):
+    """Database handle with the read preference for a class of query."""
+    # Users who just wrote something read their own writes from the primary
+    if has_request_context() and session.get('read_primary_until', 0) > time.time():
+        query_class = 'primary'
+    return connections.read_database(query_class)
+
+def read_own_writes():
+    session['read_primary_until'] = time.time() + app.config['MONGO_MAX_STALENESS_SECONDS']
+
+# Module-level handles resolve to this process's connections on first use
+db = LocalProxy(connections.database)
+redis_client = LocalProxy(connections.redis)
+redis_rate_limit = LocalProxy(connections.redis)
+redis_game = LocalProxy(connections.redis)
 
 # Custom JSON encoder for datetime objects
 class DateTimeEncoder(json.JSONEncoder):
@@ -121,20 +236,261 @@ class DateTimeEncoder(json.JSONEncoder):
 def json_dumps(obj):
     return json.dumps(obj, cls=DateTimeEncoder)
 
-# Initialize Flask-Session
-Session(app)
+_first_request_seen = False
 
-# Initialize Flask-Login
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+def record_first_request():
+    global _first_request_seen
+    if not _first_request_seen:
+        _first_request_seen = True
+        elapsed = time.perf_counter() - BOOT_STARTED
+        app.config['TIME_TO_FIRST_REQUEST'] = elapsed
+        app.logger.info(f"Worker {os.getpid()} served first request {elapsed * 1000:.1f}ms after boot")
+
+# Instrumentation: wall time and MongoDB command count per HTTP endpoint and
+# Socket.IO event, recorded only when INSTRUMENTATION_ENABLED is set
+class HandlerMetrics:
+    def __init__(self):
+        self.enabled = False
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Greenlet-local under eventlet
+
+    def start(self):
+        self._local.started = time.perf_counter()
+        self._local.db_calls = 0
+
+    def db_call(self):
+        if getattr(self._local, 'started', None) is not None:
+            self._local.db_calls += 1
+
+    def stop(self, name):
+        started = getattr(self._local, 'started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        db_calls = self._local.db_calls
+        self._local.started = None
+        with self._lock:
+            stat = self._stats.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'db_calls': 0})
+            stat['count'] += 1
+            stat['total_ms'] += elapsed * 1000
+            stat['max_ms'] = max(stat['max_ms'], elapsed * 1000)
+            stat['db_calls'] += db_calls
+
+    def snapshot(self):
+        with self._lock:
+            rows = [dict(stat, name=name,
+                         avg_ms=stat['total_ms'] / stat['count'],
+                         avg_db_calls=stat['db_calls'] / stat['count'])
+                    for name, stat in self._stats.items()]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+handler_metrics = HandlerMetrics()
+
+class DbCallCounter(monitoring.CommandListener):
+    def started(self, event):
+        handler_metrics.db_call()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def instrumented(name):
+    """Record timing for a Socket.IO handler when instrumentation is enabled."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not handler_metrics.enabled:
+                return f(*args, **kwargs)
+            handler_metrics.start()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                handler_metrics.stop(f"socket:{name}")
+        return decorated_function
+    return decorator
+
+def _start_request_timer():
+    handler_metrics.start()
+
+def _stop_request_timer(exc):
+    handler_metrics.stop(f"http:{request.endpoint}")
+
+def _os_threading():
+    # The sampler must be a real OS thread: under eventlet a green thread would
+    # only run when the code being profiled yields
+    try:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            return patcher.original('threading'), patcher.original('time')
+    except ImportError:
+        pass
+    return threading, time
+
+class SamplingProfiler:
+    """Samples every thread's stack for a fixed time and writes folded stacks
+    (one "frame;frame;frame count" line per stack) for flamegraph.pl or speedscope."""
+
+    def __init__(self):
+        self._thread = None
+        self.output = None
+        self.started_at = None
+        self.seconds = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds, interval_ms, output_dir):
+        if self.running:
+            return False
+        os.makedirs(output_dir, exist_ok=True)
+        self.output = os.path.join(output_dir, f"profile-{os.getpid()}-{int(time.time())}.folded")
+        self.started_at = utcnow()
+        self.seconds = seconds
+        os_threading, os_time = _os_threading()
+        self._thread = os_threading.Thread(target=self._run, args=(seconds, interval_ms / 1000, os_time),
+                                           daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, seconds, interval, os_time):
+        own_id = _os_threading()[0].get_ident()
+        samples = Counter()
+        deadline = os_time.monotonic() + seconds
+        while os_time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                samples[';'.join(reversed(stack))] += 1
+            os_time.sleep(interval)
+
+        with open(self.output, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+profiler = SamplingProfiler()
+
+# Static assets. build_assets.py copies each file in static/ to static/dist/
+# under a content-hashed name (plus .gz/.br variants) and writes a manifest;
+# templates link through asset_url() so the names can be cached forever.
+asset_manifest = {}
+
+def load_asset_manifest():
+    try:
+        with open(app.config['ASSET_MANIFEST']) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        app.logger.info("No asset manifest found, serving static files unversioned (run build_assets.py)")
+        manifest = {}
+    asset_manifest.clear()
+    asset_manifest.update(manifest)
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file: its fingerprinted copy when built, else the plain static URL."""
+    fingerprinted = asset_manifest.get(filename)
+    if fingerprinted is None:
+        return url_for('static', filename=filename)
+    return app.config['ASSET_URL_PREFIX'] + url_for('static_asset', filename=fingerprinted)
+
+class FallbackSessionInterface(SessionInterface):
+    """Sessions in Redis, kept on local disk while Redis is unreachable.
+
+    During an outage pages keep working; users who log in meanwhile are asked
+    to log in again once Redis is back.
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def open_session(self, app, request):
+        if redis_available():
+            try:
+                return self.primary.open_session(app, request)
+            except redis.RedisError as e:
+                app.logger.error(f"Redis session load failed, using local sessions: {str(e)}")
+        return self.fallback.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        if not isinstance(session, self.fallback.session_class) and redis_available():
+            try:
+                return self.primary.save_session(app, session, response)
+            except redis.RedisError as e:
+                app.logger.error(f"Redis session save failed, using local sessions: {str(e)}")
+        return self.fallback.save_session(app, session, response)
+
+def create_app(config=None):
+    """Configure the application and its extensions for this process.
+
+    Safe to call from every worker after fork: nothing here touches MongoDB or
+    Redis, and no game state is written. The live round is left untouched.
+    """
+    if 'socketio' in app.extensions:
+        return app
+
+    if config:
+        app.config.update(config)
+
+    message_queue = app.config['SOCKETIO_MESSAGE_QUEUE']
+    if app.config['REDIS_HOST']:
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = redis.Redis(connection_pool=connections.redis_pool())
+        if not message_queue:
+            password = quote(app.config['REDIS_PASSWORD'] or '', safe='')
+            message_queue = f"redis://:{password}@{app.config['REDIS_HOST']}:{app.config['REDIS_PORT']}/{app.config['REDIS_DB']}"
+
+    load_asset_manifest()
+
+    # Enable CORS
+    CORS(app)
+    server_session.init_app(app)
+    if app.config['SESSION_TYPE'] == 'redis':
+        app.session_interface = FallbackSessionInterface(app.session_interface, FileSystemSessionInterface(
+            app.config.get('SESSION_FILE_DIR', os.path.join(os.getcwd(), 'flask_session')),
+            app.config.get('SESSION_FILE_THRESHOLD', 500),
+            app.config.get('SESSION_FILE_MODE', 384),
+            app.config.get('SESSION_KEY_PREFIX', 'session:'),
+            app.config.get('SESSION_USE_SIGNER', False),
+            app.config.get('SESSION_PERMANENT', True)
+        ))
+    login_manager.init_app(app)
+    app.before_request(record_first_request)
+    app.before_request(start_background_tasks)
+    if app.config['INSTRUMENTATION_ENABLED']:
+        handler_metrics.enabled = True
+        app.before_request(_start_request_timer)
+        app.teardown_request(_stop_request_timer)
+
+    socketio.init_app(
+        app,
+        message_queue=message_queue,
+        cors_allowed_origins="*",
+        logger=app.config['SOCKETIO_LOGGER'],
+        engineio_logger=app.config['SOCKETIO_LOGGER']
+    )
+
+    app.logger.info(f"Worker {os.getpid()} app created {(time.perf_counter() - BOOT_STARTED) * 1000:.1f}ms after boot")
+    return app
 
 # Rate limiting decorator with fallback
 def rate_limit(limit=10, window=60):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if not REDIS_AVAILABLE:
+            if not redis_available():
                 return f(*args, **kwargs)  # Skip rate limiting if Redis is down
                 
             if current_user.is_authenticated:
@@ -155,35 +511,67 @@ def rate_limit(limit=10, window=60):
         return decorated_function
     return decorator
 
+# Round timing. Phases end at stored deadlines rather than at a counter that is
+# decremented every second, so any process can work out where a round is.
+ROUND_SECONDS = 300
+BREAK_SECONDS = 15
+JOIN_CUTOFF_SECONDS = 10  # Joins close this long before the deadline
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+def as_utc(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def seconds_left(game_data, now=None):
+    """Seconds remaining in the round's current phase."""
+    deadline = game_data.get('break_ends_at' if game_data.get('is_break') else 'ends_at')
+    if not deadline:
+        return 0  # No deadline recorded: treat the phase as over rather than stall
+    return max(0, math.ceil((as_utc(deadline) - (now or utcnow())).total_seconds()))
+
 # Game state management with fallback to MongoDB
 class GameState:
     def __init__(self):
+        # No round is created here; the timer loop starts one if none is live,
+        # so a worker restart never replaces the round in progress
         self.game_key = "current_game"
-        self.reset_game()
+        self.cache_ttl = 3600  # Outlives any phase; MongoDB stays the durable copy
     
     def reset_game(self):
+        now = utcnow()
         game_data = {
             'status': 'joining',
             'players': [],
-            'timer': 300,
-            'break_timer': 15,  # 15 second break timer
+            'timer': ROUND_SECONDS,
+            'break_timer': BREAK_SECONDS,
             'is_break': False,
             'game_id': str(uuid.uuid4()),
-            'created_at': datetime.now(timezone.utc)
+            'spin_seed': secrets.token_hex(16),  # Decides the winner; never sent to clients
+            'created_at': now,
+            'ends_at': now + timedelta(seconds=ROUND_SECONDS)
         }
         
         # Always store in MongoDB for persistence
         db.game_history.insert_one(game_data)
+        round_events.append('created', game_data['game_id'], ends_at=game_data['ends_at'].isoformat())
         
-        if REDIS_AVAILABLE:
+        self.restore(game_data)
+
+    def restore(self, game_data):
+        """Put a round loaded from MongoDB back into the Redis cache."""
+        if redis_available():
             try:
-                # Store temporary game state in Redis with 5-minute expiry
-                redis_game.setex(self.game_key, 300, json_dumps(game_data))
+                redis_game.setex(self.game_key, self.cache_ttl, json_dumps(game_data))
             except redis.RedisError as e:
                 app.logger.error(f"Redis game state storage failed: {str(e)}")
     
     def get_game_state(self):
-        if REDIS_AVAILABLE:
+        if redis_available():
             try:
                 state = redis_game.get(self.game_key)
                 if state:
@@ -198,6 +586,54 @@ class GameState:
             state['_id'] = str(state['_id'])
         return state or {'status': 'error'}
 
+    def add_players(self, game_id, players):
+        """Append players atomically and return the updated round.
+
+        Players already on the stored roster are skipped, so a player can never
+        hold two slots. Returns None when the round is no longer open for joins,
+        e.g. because the engine closed it after the caller read the state.
+        """
+        open_round = {'game_id': game_id, 'status': 'joining', 'is_break': False, 'ends_at': {'$gt': utcnow()}}
+        updated = db.game_history.find_one_and_update(
+            dict(open_round, **{'players.id': {'$nin': [p['id'] for p in players]}}),
+            {'$push': {'players': {'$each': players}}},
+            projection={'_id': 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is None:
+            # Closed, or some of them are already on the roster: push the others one by one
+            for player in players:
+                updated = db.game_history.find_one_and_update(
+                    dict(open_round, **{'players.id': {'$ne': player['id']}}),
+                    {'$push': {'players': player}},
+                    projection={'_id': 0},
+                    return_document=ReturnDocument.AFTER
+                ) or updated
+            if updated is None:
+                updated = db.game_history.find_one(open_round, {'_id': 0})
+        if updated and redis_available():
+            try:
+                # Several workers may push at once; only ever grow the cached roster
+                with redis_game.pipeline() as pipe:
+                    while True:
+                        try:
+                            pipe.watch(self.game_key)
+                            cached = pipe.get(self.game_key)
+                            cached = json.loads(cached) if cached else None
+                            if cached and cached.get('game_id') == game_id:
+                                if len(cached.get('players', [])) >= len(updated['players']):
+                                    pipe.unwatch()
+                                    return cached
+                            pipe.multi()
+                            pipe.setex(self.game_key, self.cache_ttl, json_dumps(updated))
+                            pipe.execute()
+                            break
+                        except redis.WatchError:
+                            continue
+            except redis.RedisError as e:
+                app.logger.error(f"Redis game state update failed: {str(e)}")
+        return updated
+
     def update_game_state(self, updates):
         # Update MongoDB first for persistence
         current = self.get_game_state()
@@ -212,25 +648,320 @@ class GameState:
             {'$set': updates}
         )
         
-        if REDIS_AVAILABLE:
+        if redis_available():
             try:
-                redis_game.setex(self.game_key, 300, json_dumps(current))
+                redis_game.setex(self.game_key, self.cache_ttl, json_dumps(current))
             except redis.RedisError as e:
                 app.logger.error(f"Redis game state update failed: {str(e)}")
 
-# Socket.IO setup with Redis if available
-if REDIS_AVAILABLE:
-    socketio = SocketIO(
-        app,
-        message_queue='redis://:6KPxcgIqJWTsDvfG5h2y1e0LJ12OuFp0@redis-14464.c301.ap-south-1-1.ec2.redns.redis-cloud.com:14464/0',
-        cors_allowed_origins="*",
-        logger=True,
-        engineio_logger=True
-    )
-else:
-    socketio = SocketIO(app, cors_allowed_origins="*")
+# Notification outbox: events are queued in memory, delivered immediately to the
+# user's private socket room and persisted to MongoDB in batches by a background task
+class NotificationOutbox:
+    def __init__(self, flush_interval=2, batch_size=500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.unread_key = "notifications:unread:{}"
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._indexed = False
+        self.background = True  # False: the caller flushes (simulator)
+
+    def enqueue(self, user_id, kind, message, data=None):
+        notification = {
+            '_id': ObjectId(),
+            'user_id': ObjectId(user_id),
+            'type': kind,
+            'message': message,
+            'data': data or {},
+            'read': False,
+            'created_at': datetime.now(timezone.utc)
+        }
+
+        with self._lock:
+            self._pending.append(notification)
+            if self._flusher is None and self.background:
+                self._flusher = socketio.start_background_task(self._run)
+
+        # Push to the user's private room only; persistence happens in the next batch
+        socketio.emit('notification', json.loads(json_dumps(notification)), to=user_room(user_id))
+        return notification
+
+    def flush(self):
+        with self._lock:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+
+        if not batch:
+            return 0
+
+        try:
+            if not self._indexed:
+                db.notifications.create_index([('user_id', 1), ('created_at', -1)])
+                db.notifications.create_index([('user_id', 1), ('read', 1)])
+                self._indexed = True
+            db.notifications.insert_many(batch, ordered=False)
+        except Exception as e:
+            app.logger.error(f"Notification flush failed: {str(e)}")
+            # Put the batch back so it is retried on the next flush
+            with self._lock:
+                self._pending[:0] = batch
+            return 0
+
+        if redis_available():
+            counts = {}
+            for notification in batch:
+                user_id = str(notification['user_id'])
+                counts[user_id] = counts.get(user_id, 0) + 1
+            try:
+                # Only bump counters that are already cached; a miss is recomputed on read
+                pipe = redis_game.pipeline(transaction=False)
+                for user_id in counts:
+                    pipe.exists(self.unread_key.format(user_id))
+                cached = pipe.execute()
+                pipe = redis_game.pipeline(transaction=False)
+                for (user_id, count), exists in zip(counts.items(), cached):
+                    if exists:
+                        pipe.incrby(self.unread_key.format(user_id), count)
+                pipe.execute()
+            except redis.RedisError as e:
+                app.logger.error(f"Unread count cache update failed: {str(e)}")
+
+        return len(batch)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.flush_interval)
+            try:
+                while self.flush() == self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Notification outbox error: {str(e)}")
+
+    def unread_count(self, user_id):
+        key = self.unread_key.format(user_id)
+        if redis_available():
+            try:
+                cached = redis_game.get(key)
+                if cached is not None:
+                    return int(cached)
+            except redis.RedisError as e:
+                app.logger.error(f"Unread count cache read failed: {str(e)}")
+
+        count = db.notifications.count_documents({'user_id': ObjectId(user_id), 'read': False})
+        if redis_available():
+            try:
+                redis_game.set(key, count, ex=600, nx=True)
+            except redis.RedisError as e:
+                app.logger.error(f"Unread count cache write failed: {str(e)}")
+        return count
+
+    def invalidate(self, user_id):
+        if redis_available():
+            try:
+                redis_game.delete(self.unread_key.format(user_id))
+            except redis.RedisError as e:
+                app.logger.error(f"Unread count cache invalidation failed: {str(e)}")
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+notification_outbox = NotificationOutbox()
+
+# Round lifecycle event stream for downstream consumers (analytics, audit, replay).
+# Event types: created, player_joined, phase, winner, payout, refund.
+# Backed by a Redis Stream with consumer groups, or a capped MongoDB collection
+# with per-group offsets when Redis is not available. Sequence numbers always
+# come from one MongoDB counter, so they never overlap between the two. Events
+# written to MongoDB during a Redis outage are forwarded to the stream once
+# Redis is back (automatically, or with `flask forward-round-events`); delivery
+# is at-least-once and stream order may differ from seq, so consumers dedupe
+# and order by seq.
+class RoundEventStream:
+    def __init__(self, maxlen=100000, capped_size=64 * 1024 * 1024):
+        self.stream_key = "round_events"
+        self.forwarded_offset = "_forwarded_to_redis"
+        self.maxlen = maxlen
+        self.capped_size = capped_size
+        self._collection_ready = False
+        self._fallback_pending = False
+
+    def _collection(self):
+        if not self._collection_ready:
+            try:
+                db.create_collection('round_events', capped=True, size=self.capped_size)
+                db.round_events.create_index('seq')
+                db.round_events.create_index('game_id')
+            except CollectionInvalid:
+                pass  # Already exists
+            self._collection_ready = True
+        return db.round_events
+
+    def append(self, kind, game_id, **data):
+        return self.append_many([(kind, game_id, data)])[0]
+
+    def append_many(self, entries):
+        """Append (kind, game_id, data) events with one counter write and one Redis round trip."""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        events = [{'type': kind, 'game_id': game_id, 'timestamp': timestamp, 'data': data}
+                  for kind, game_id, data in entries]
+        if not events:
+            return events
+        try:
+            # Reserve a block of sequence numbers for the whole batch
+            counter = db.counters.find_one_and_update(
+                {'_id': self.stream_key},
+                {'$inc': {'seq': len(events)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            for seq, event in enumerate(events, start=counter['seq'] - len(events) + 1):
+                event['seq'] = seq
+
+            if redis_available():
+                try:
+                    self._xadd(events)
+                    if self._fallback_pending:
+                        self.forward_fallback()
+                    return events
+                except redis.RedisError as e:
+                    app.logger.error(f"Round event append to Redis failed: {str(e)}")
+
+            self._collection().insert_many([dict(event) for event in events])
+            self._fallback_pending = True
+        except Exception as e:
+            # The event stream must never break the round itself
+            app.logger.error(f"Round event append failed: {str(e)}")
+        return events
+
+    def _xadd(self, events):
+        pipe = redis_game.pipeline(transaction=False)
+        for event in events:
+            pipe.xadd(self.stream_key, {
+                'seq': event['seq'],
+                'type': event['type'],
+                'game_id': event['game_id'] or '',
+                'timestamp': event['timestamp'],
+                'data': json_dumps(event['data'])
+            }, maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+    def forward_fallback(self, batch_size=1000):
+        """Copy events written to MongoDB while Redis was down into the stream."""
+        forwarded = 0
+        while True:
+            offset = db.round_event_offsets.find_one({'_id': self.forwarded_offset}) or {'seq': 0}
+            events = list(self._collection().find({'seq': {'$gt': offset['seq']}}, {'_id': 0})
+                          .sort('seq', 1).limit(batch_size))
+            if events:
+                self._xadd(events)
+                db.round_event_offsets.update_one(
+                    {'_id': self.forwarded_offset},
+                    {'$max': {'seq': events[-1]['seq']}},
+                    upsert=True
+                )
+                forwarded += len(events)
+            if len(events) < batch_size:
+                break
+        self._fallback_pending = False
+        return forwarded
+
+    def _decode(self, fields):
+        fields = {_text(k): _text(v) for k, v in fields.items()}
+        return {
+            'seq': int(fields['seq']),
+            'type': fields['type'],
+            'game_id': fields['game_id'] or None,
+            'timestamp': fields['timestamp'],
+            'data': json.loads(fields['data'])
+        }
+
+    def read_group(self, group, consumer, count=100, block_ms=None):
+        """Return up to `count` (offset, event) pairs not yet delivered to `group`."""
+        if redis_available():
+            try:
+                redis_game.xgroup_create(self.stream_key, group, id='0', mkstream=True)
+            except redis.ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+            response = redis_game.xreadgroup(group, consumer, {self.stream_key: '>'},
+                                             count=count, block=block_ms)
+            if not response:
+                return []
+            return [(_text(entry_id), self._decode(fields)) for entry_id, fields in response[0][1]]
+
+        offset = db.round_event_offsets.find_one({'_id': group}) or {'seq': 0}
+        events = self._collection().find({'seq': {'$gt': offset['seq']}}, {'_id': 0}).sort('seq', 1).limit(count)
+        return [(event['seq'], event) for event in events]
+
+    def ack(self, group, offsets):
+        if not offsets:
+            return
+        if redis_available():
+            redis_game.xack(self.stream_key, group, *offsets)
+            return
+        db.round_event_offsets.update_one(
+            {'_id': group},
+            {'$max': {'seq': max(offsets)}},
+            upsert=True
+        )
+
+    def iter_events(self, batch_size=1000):
+        """Iterate the whole retained stream in sequence order."""
+        if redis_available():
+            start = '-'
+            while True:
+                entries = redis_game.xrange(self.stream_key, min=start, count=batch_size)
+                for entry_id, fields in entries:
+                    yield self._decode(fields)
+                if len(entries) < batch_size:
+                    return
+                start = '(' + _text(entries[-1][0])
+        else:
+            yield from self._collection().find({}, {'_id': 0}).sort('seq', 1)
+
+    def replay(self, game_id):
+        events = {event['seq']: event for event in self.iter_events() if event['game_id'] == game_id}
+        return [events[seq] for seq in sorted(events)]
+
+    def rebuild_stats(self, events=None):
+        stats = {'rounds': 0, 'settled': 0, 'refunded': 0, 'joins': 0,
+                 'entry_fees': 0, 'payouts': 0, 'platform_fees': 0, 'refunds': 0, 'users': {}}
+        refunded_rounds = set()
+        seen = set()
+        for event in self.iter_events() if events is None else events:
+            if event['seq'] in seen:
+                continue  # Forwarded more than once
+            seen.add(event['seq'])
+            data = event['data']
+            if event['type'] == 'created':
+                stats['rounds'] += 1
+            elif event['type'] == 'player_joined':
+                stats['joins'] += 1
+                stats['entry_fees'] += data.get('entry_fee', 0)
+                user = stats['users'].setdefault(data['user_id'], {'rounds': 0, 'wins': 0, 'winnings': 0})
+                user['rounds'] += 1
+            elif event['type'] == 'payout':
+                stats['settled'] += 1
+                stats['payouts'] += data.get('amount', 0)
+                stats['platform_fees'] += data.get('platform_fee', 0)
+                user = stats['users'].setdefault(data['user_id'], {'rounds': 0, 'wins': 0, 'winnings': 0})
+                user['wins'] += 1
+                user['winnings'] += data.get('amount', 0)
+            elif event['type'] == 'refund':
+                stats['refunds'] += data.get('amount', 0)
+                if data.get('round_refunded'):
+                    refunded_rounds.add(event['game_id'])
+        stats['refunded'] = len(refunded_rounds)
+        return stats
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+round_events = RoundEventStream()
 
 @socketio.on('place_bet')
+@instrumented('place_bet')
 @rate_limit(limit=5, window=10)  # Limit to 5 bets per 10 seconds
 def handle_bet(data):
     if not current_user.is_authenticated:
@@ -240,6 +971,7 @@ def handle_bet(data):
     emit('bet_placed', {'user': current_user.id, 'amount': data.get('amount')}, broadcast=True)
 
 @socketio.on('spin_wheel')
+@instrumented('spin_wheel')
 @rate_limit(limit=1, window=5)  # Limit to 1 spin per 5 seconds
 def handle_spin(data):
     if not current_user.is_authenticated:
@@ -249,40 +981,6 @@ def handle_spin(data):
     result = random.randint(0, 36)
     emit('wheel_result', {'result': result}, broadcast=True)
 
-@socketio.on('timer')
-def handle_timer(data):
-    game_data = game_state.get_game_state()
-    current_time = data.get('time', 0)
-    
-    # Don't allow joining in last 10 seconds
-    if current_time <= 10:
-        game_state.update_game_state({'status': 'running'})
-    
-    if current_time <= 0 and game_data['status'] == 'running':
-        winner = select_winner()
-        if winner:
-            socketio.emit('winner_selected', {
-                'winner': {
-                    'username': winner['username'],
-                    'emoji': winner['emoji'],
-                    'prize': winner['prize'],  # Make sure prize is included
-                    'wallet_balance': winner['wallet_balance']
-                }
-            })
-            
-            # Reset game state after winner selection
-            game_state.update_game_state({
-                'status': 'joining',
-                'players': [],
-                'timer': 300,
-                'is_break': True
-            })
-            
-            # Start break timer
-            socketio.emit('break_timer', {'duration': 15})
-    
-    socketio.emit('timer', {'time': max(0, current_time)})
-
 # Example of rate-limited API endpoint
 @app.route('/api/place_bet', methods=['POST'])
 @login_required
@@ -295,9 +993,24 @@ def place_bet():
 @login_required
 def get_user_games():
     try:
-        # Get user's game history
-        user = db.users.find_one({'_id': ObjectId(current_user.id)})
-        if not user or 'game_history' not in user:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+
+    try:
+        # Counters plus one page of the user's history, newest first
+        history = read_db('history')
+        user = next(history.users.aggregate([
+            {'$match': {'_id': ObjectId(current_user.id)}},
+            {'$project': {
+                'stats': 1,
+                'history_count': {'$size': {'$ifNull': ['$game_history', []]}},
+                'page': {'$slice': [{'$reverseArray': {'$ifNull': ['$game_history', []]}},
+                                    (page - 1) * per_page, per_page]}
+            }}
+        ]), None)
+        if not user:
             return jsonify({
                 'games': [],
                 'total_games': 0,
@@ -305,9 +1018,24 @@ def get_user_games():
                 'total_earnings': 0
             })
 
-        # Get full game details for each game in user's history
-        game_ids = [g['game_id'] for g in user.get('game_history', [])]
-        games = list(db.games.find({'_id': {'$in': game_ids}}))
+        stats = user.get('stats')
+        if stats is None:
+            # No settlement or refund since the counters were added (they are backfilled on the first one)
+            stats = compute_user_stats(db.users.find_one({'_id': ObjectId(current_user.id)}))
+
+        # Get full game details for each game on this page
+        game_ids = [g['game_id'] for g in user['page']]
+        games = list(history.games.find({'_id': {'$in': game_ids}}))
+        
+        # Games past the retention cutoff live in the per-day archive
+        found = {game['_id'] for game in games}
+        archived_by_day = {}
+        for entry in user['page']:
+            if entry['game_id'] not in found:
+                archived_by_day.setdefault(day_key(as_utc(entry['timestamp'])), set()).add(str(entry['game_id']))
+        archived_games = []
+        for day, ids in archived_by_day.items():
+            archived_games.extend(load_archived_games(day, ids)[1])
         
         # Format games for response
         formatted_games = []
@@ -324,28 +1052,145 @@ def get_user_games():
                 }
             }
             formatted_games.append(formatted_game)
-        
-        # Calculate statistics
-        game_history = user.get('game_history', [])
-        total_wins = sum(1 for g in game_history if g.get('won', False))
-        total_earnings = sum(g['prize_pool'] for g in game_history if g.get('won', False))
+        for game in archived_games:
+            formatted_games.append({
+                'id': game['id'],
+                'timestamp': game['timestamp'],
+                'participant_count': game['participant_count'],
+                'prize_pool': game['total_pool'],
+                'winner': game['winner']
+            })
+        formatted_games.sort(key=lambda game: game['timestamp'], reverse=True)
         
         return jsonify({
             'games': formatted_games,
-            'total_games': len(formatted_games),
-            'total_wins': total_wins,
-            'total_earnings': total_earnings
+            'total_games': stats.get('games_played', 0),
+            'total_wins': stats.get('wins', 0),
+            'total_earnings': stats.get('earnings', 0),
+            'stats': {field: stats.get(field, 0) for field in USER_STATS_FIELDS},
+            'page': page,
+            'per_page': per_page,
+            'has_more': page * per_page < user['history_count']
         })
     
     except Exception as e:
         print(f"Error in get_user_games: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Per-user counters kept in users.stats. games_played, entry_fees, wins,
+# earnings and net change atomically with the settlement writes; refunds with
+# the refund write. Entry fees are counted when a round is settled, so a
+# refunded entry never shows up in games_played or net.
+USER_STATS_FIELDS = ('games_played', 'wins', 'earnings', 'entry_fees', 'refunds', 'net')
+
+def compute_user_stats(user):
+    """Recompute a user's counters from their game history."""
+    game_history = (user or {}).get('game_history', [])
+    games_played = len(game_history)
+    wins = sum(1 for g in game_history if g.get('won', False))
+    earnings = sum(int(g.get('prize_pool', 0) * 0.8) for g in game_history if g.get('won', False))
+    entry_fees = games_played * 10
+    return {
+        'games_played': games_played,
+        'wins': wins,
+        'earnings': earnings,
+        'entry_fees': entry_fees,
+        # Only the last 50 refunds are kept per user, so this is a lower bound
+        'refunds': len((user or {}).get('refunded_games', [])) * 10,
+        'net': earnings - entry_fees
+    }
+
+def backfill_user_stats(user_ids):
+    """Give users created before the counters existed a complete stats document.
+
+    Must run before the first $inc on a user: incrementing a missing stats
+    field creates a partial document that hides the earlier history.
+    """
+    for user in db.users.find({'_id': {'$in': user_ids}, 'stats': {'$exists': False}},
+                              {'game_history': 1, 'refunded_games': 1}):
+        db.users.update_one({'_id': user['_id'], 'stats': {'$exists': False}},
+                            {'$set': {'stats': compute_user_stats(user)}})
+
+@app.cli.command('check-user-stats')
+@click.option('--fix', is_flag=True, help='Overwrite counters that do not match.')
+def check_user_stats_command(fix):
+    """Compare every user's counters with a recomputation from their history."""
+    mismatched = 0
+    for user in db.users.find({}, {'game_history': 1, 'refunded_games': 1, 'stats': 1, 'username': 1}):
+        expected = compute_user_stats(user)
+        actual = user.get('stats') or {}
+        # Refunds can only be checked as a lower bound
+        differences = {field: (actual.get(field, 0), expected[field]) for field in USER_STATS_FIELDS
+                       if field != 'refunds' and actual.get(field, 0) != expected[field]}
+        if actual.get('refunds', 0) < expected['refunds']:
+            differences['refunds'] = (actual.get('refunds', 0), expected['refunds'])
+        else:
+            expected['refunds'] = actual.get('refunds', 0)
+        if differences:
+            mismatched += 1
+            click.echo(f"{user.get('username', user['_id'])}: {differences}")
+            if fix:
+                db.users.update_one({'_id': user['_id']}, {'$set': {'stats': expected}})
+    click.echo(f"{mismatched} users with mismatched counters" + (" (fixed)" if fix and mismatched else ""))
+
+# Read-only view of the current round for spectators. The body only changes on
+# state transitions (it carries deadlines, not a ticking timer), so it is built
+# at most once per SNAPSHOT_MAX_AGE per worker and revalidated with ETags by
+# browsers and any caching proxy in front of the app.
+class SpectatorSnapshot:
+    def __init__(self, max_age=1):
+        self.max_age = max_age
+        self._cached = None
+
+    def build(self):
+        game_data = game_state.get_game_state()
+        is_break = game_data.get('is_break', False)
+        deadline = game_data.get('break_ends_at' if is_break else 'ends_at')
+        last_game = read_db('history').games.find_one(
+            {'status': 'completed'},
+            {'winner': 1, 'winner_prize': 1, 'game_id': 1},
+            sort=[('timestamp', -1)]
+        )
+        snapshot = {
+            'game_id': game_data.get('game_id'),
+            'status': game_data.get('status'),
+            'is_break': is_break,
+            'players': [{'id': p['id'], 'username': p['username'], 'emoji': p.get('emoji')}
+                        for p in game_data.get('players', [])],
+            'deadline': as_utc(deadline).isoformat() if deadline else None,
+            'last_winner': {
+                'game_id': last_game.get('game_id'),
+                'username': last_game['winner']['username'],
+                'emoji': last_game['winner']['emoji'],
+                'prize': last_game.get('winner_prize', 0)
+            } if last_game and isinstance(last_game.get('winner'), dict) else None
+        }
+        if not deadline:
+            snapshot['timer'] = seconds_left(game_data)
+        return snapshot
+
+    def get(self):
+        cached = self._cached
+        if cached is None or time.monotonic() - cached[0] >= self.max_age:
+            body = json_dumps(self.build()).encode('utf-8')
+            cached = self._cached = (time.monotonic(), hashlib.sha1(body).hexdigest(), body)
+        return cached[1], cached[2]
+
+spectator_snapshot = SpectatorSnapshot()
+
+@app.route('/api/game/snapshot', methods=['GET'])
+def get_game_snapshot():
+    etag, body = spectator_snapshot.get()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=1, stale-while-revalidate=2'
+    return response.make_conditional(request)
+
 @app.route('/api/games/recent', methods=['GET'])
 def get_recent_games():
     try:
         # Get 10 most recent games
-        recent_games = list(db.games.find().sort('timestamp', -1).limit(10))
+        recent_games = list(read_db('history').games.find().sort('timestamp', -1).limit(10))
         
         # Format games for response
         formatted_games = []
@@ -369,6 +1214,67 @@ def get_recent_games():
         print(f"Error in get_recent_games: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/notifications', methods=['GET'])
+@login_required
+def get_notifications():
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+
+    try:
+        # Make sure anything still queued in this worker is visible
+        notification_outbox.flush()
+
+        notifications = list(db.notifications.find(
+            {'user_id': ObjectId(current_user.id)}
+        ).sort('created_at', -1).skip((page - 1) * per_page).limit(per_page + 1))
+
+        formatted_notifications = []
+        for notification in notifications[:per_page]:
+            formatted_notifications.append({
+                'id': str(notification['_id']),
+                'type': notification['type'],
+                'message': notification['message'],
+                'data': notification.get('data', {}),
+                'read': notification.get('read', False),
+                'created_at': notification['created_at'].isoformat()
+            })
+
+        return jsonify({
+            'notifications': formatted_notifications,
+            'page': page,
+            'per_page': per_page,
+            'has_more': len(notifications) > per_page,
+            'unread_count': notification_outbox.unread_count(current_user.id)
+        })
+
+    except Exception as e:
+        print(f"Error in get_notifications: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/notifications/unread_count', methods=['GET'])
+@login_required
+def get_unread_count():
+    return jsonify({'unread_count': notification_outbox.unread_count(current_user.id)})
+
+@app.route('/api/notifications/read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    query = {'user_id': ObjectId(current_user.id), 'read': False}
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if ids:
+        try:
+            query['_id'] = {'$in': [ObjectId(i) for i in ids]}
+        except Exception:
+            return jsonify({'error': 'Invalid notification id'}), 400
+
+    notification_outbox.flush()
+    result = db.notifications.update_many(query, {'$set': {'read': True}})
+    notification_outbox.invalidate(current_user.id)
+    return jsonify({'success': True, 'updated': result.modified_count})
+
 class User(UserMixin):
     def __init__(self, user_id):
         self.id = user_id
@@ -406,131 +1312,316 @@ class User(UserMixin):
 def load_user(user_id):
     return User.get(user_id)
 
+class EngineLease:
+    """Lease so that only one process drives a background loop at a time.
+
+    Held in Redis when it is available and in the MongoDB leases collection
+    otherwise; if neither can be reached the lease is not granted.
+    """
+
+    def __init__(self, key="round_engine:leader", ttl=5):
+        self.key = key
+        self.token = f"{os.getpid()}:{uuid.uuid4()}"
+        self.ttl = ttl
+
+    def acquire(self):
+        if not redis_available():
+            return self._acquire_mongo()
+        try:
+            if redis_game.set(self.key, self.token, nx=True, ex=self.ttl):
+                return True
+            if _text(redis_game.get(self.key)) == self.token:
+                redis_game.expire(self.key, self.ttl)
+                return True
+            return False
+        except redis.RedisError as e:
+            app.logger.error(f"Round engine lease failed: {str(e)}")
+            return self._acquire_mongo()
+
+    def _acquire_mongo(self):
+        # Wall-clock time, not utcnow(): the simulator moves utcnow() by minutes
+        now = datetime.now(timezone.utc)
+        try:
+            db.leases.find_one_and_update(
+                {'_id': self.key, '$or': [{'holder': self.token}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'holder': self.token, 'expires_at': now + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False  # Held by another process and not expired
+        except PyMongoError as e:
+            app.logger.error(f"Round engine lease failed: {str(e)}")
+            return False
+
+# Compact encoding for round broadcasts. Clients that connect with
+# ?encoding=packed get each event as a msgpack-packed positional array: no
+# repeated keys, and players as [id, username, emoji] rows in join order, so
+# a player's index is stable for the whole round. Everyone else keeps JSON.
+# Small events (timer, game_end) stay JSON for everyone: the binary
+# attachment's placeholder header costs more than packing them saves.
+# A client that missed a player_joined cannot fill the gap, so it asks for
+# a full game_status (sync_game_status), and game_end carries the roster.
+PACKED_ROOM = 'encoding:packed'
+JSON_ROOM = 'encoding:json'
+
+def _player_rows(players):
+    return [[p['id'], p['username'], p.get('emoji', '🎮')] for p in players]
+
+PACKED_EVENTS = {
+    'game_status': lambda d: [d['status'], d['timer'], d['isBreak'], _player_rows(d['players'])],
+    # Clients keep the roster, so only the rows after the first player_count - len(rows) are sent
+    'player_joined': lambda d: [d['player_count'], _player_rows(d['new_players'])]
+}
+
+def pack_event(event, data):
+    return msgpack.packb(PACKED_EVENTS[event](data), use_bin_type=True)
+
+def wants_packed_events():
+    return app.config['SOCKETIO_PACKED_EVENTS'] and request.args.get('encoding') == 'packed'
+
+def broadcast(event, data):
+    """Emit a round event to every client, in the encoding each one negotiated."""
+    if not app.config['SOCKETIO_PACKED_EVENTS'] or event not in PACKED_EVENTS:
+        socketio.emit(event, data)
+        return
+    socketio.emit(event, data, to=JSON_ROOM)
+    socketio.emit(event, pack_event(event, data), to=PACKED_ROOM)
+
+def game_status_payload(game_data):
+    return {
+        'status': game_data['status'],
+        'players': game_data.get('players', []),
+        'timer': seconds_left(game_data),
+        'isBreak': game_data.get('is_break', False)
+    }
+
+def emit_game_status(game_data):
+    broadcast('game_status', game_status_payload(game_data))
+
+def emit_game_status_to_client():
+    status = game_status_payload(game_state.get_game_state())
+    emit('game_status', pack_event('game_status', status) if wants_packed_events() else status)
+
+def start_new_round():
+    game_state.reset_game()
+    emit_game_status(game_state.get_game_state())
+
+def spin_plan(game_data, winner):
+    """Where every client's wheel stops for this round's winner.
+
+    Segments are laid out clockwise in join order from the pointer at the top,
+    so rotating the wheel clockwise by target_angle degrees lands inside the
+    winner's segment. The seed sent to clients is derived from the round's
+    secret one and only drives the cosmetic parts: landing spot, turns and
+    spin duration.
+    """
+    players = game_data['players']
+    index = next(i for i, player in enumerate(players) if player['id'] == winner['id'])
+    seed = hashlib.sha256(f"{game_data.get('spin_seed') or game_data['game_id']}:spin".encode()).hexdigest()[:16]
+    rng = random.Random(seed)
+    segment = 360 / len(players)
+    landing = (index + rng.uniform(0.15, 0.85)) * segment
+    return {
+        'winner_index': index,
+        'spin_seed': seed,
+        'target_angle': round(rng.randint(5, 8) * 360 + 360 - landing, 2)
+    }
+
+def finish_round(game_data):
+    """Settle (or refund) a round whose joining phase is over and start the break.
+
+    If settlement fails the exception propagates before anything is broadcast
+    or the round moves on, so the next tick or recover_round retries it.
+    """
+    # Close joins and settle the roster stored with the round, not the
+    # snapshot this tick started from; a later join can no longer land
+    closed = db.game_history.find_one_and_update(
+        {'game_id': game_data.get('game_id')},
+        {'$set': {'status': 'running'}},
+        projection={'_id': 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if closed:
+        game_data = closed
+        game_state.restore(closed)
+
+    winner = settle_round(game_data)
+    has_players = bool(game_data.get('players'))
+
+    # game_end carries the spin and the break, so no game_status follows it
+    round_end = {
+        'winner': winner['username'] if winner else None,
+        'prize': winner['prize'] if winner else 0,
+        'timer': BREAK_SECONDS if has_players else 0,
+        'isBreak': has_players,
+        # The full roster, so clients that missed a join still spin the right wheel
+        'players': game_data.get('players', [])
+    }
+    if winner:
+        round_end.update(spin_plan(game_data, winner))
+    broadcast('game_end', round_end)
+
+    if not has_players:
+        start_new_round()
+        return winner
+
+    # Start break time
+    round_events.append('phase', game_data.get('game_id'), phase='break')
+    game_state.update_game_state({
+        'status': 'break',
+        'is_break': True,
+        'break_timer': BREAK_SECONDS,
+        'break_ends_at': utcnow() + timedelta(seconds=BREAK_SECONDS)
+    })
+    return winner
+
+def tick_round(now=None):
+    """Advance the round state machine by one step."""
+    game_data = game_state.get_game_state()
+
+    if game_data.get('status') == 'error':
+        # No round has been started yet
+        start_new_round()
+        return
+
+    remaining = seconds_left(game_data, now)
+    if game_data.get('is_break', False):
+        if remaining > 0:
+            broadcast('timer', {'time': remaining, 'isBreak': True})
+        else:
+            # Break time over, start new game
+            start_new_round()
+    elif game_data.get('status') in ('joining', 'running'):
+        broadcast('timer', {'time': remaining, 'isBreak': False})
+        if remaining <= 0:
+            finish_round(game_data)
+        elif remaining <= JOIN_CUTOFF_SECONDS and game_data.get('status') == 'joining':
+            round_events.append('phase', game_data.get('game_id'), phase='running')
+            game_state.update_game_state({'status': 'running'})
+
+def recover_round():
+    """Resume, settle or refund the latest round after the engine (re)starts.
+
+    Reads only the durable copy in MongoDB, so it does not depend on the Redis
+    key still being alive. Work is bounded: one read plus at most one
+    settlement, which is idempotent per round.
+    """
+    started = time.perf_counter()
+    outcome = 'none'
+
+    game_data = db.game_history.find_one({}, sort=[('created_at', -1)])
+    if game_data:
+        game_data.pop('_id', None)
+        if not game_data.get('is_break') and game_data.get('status') in ('joining', 'running'):
+            if not game_data.get('ends_at'):
+                game_data['ends_at'] = as_utc(game_data['created_at']) + timedelta(seconds=ROUND_SECONDS)
+            game_state.restore(game_data)
+            if seconds_left(game_data) > 0:
+                outcome = 'resumed'
+            else:
+                outcome = 'settled' if finish_round(game_data) else 'refunded'
+        elif game_data.get('is_break'):
+            game_state.restore(game_data)
+            outcome = 'break'
+
+    app.logger.info(f"Round recovery: {outcome} in {(time.perf_counter() - started) * 1000:.1f}ms")
+    return outcome
+
 def update_game_timer():
+    lease = EngineLease()
+    leading = False
     while True:
         try:
             with app.app_context():
-                game_data = game_state.get_game_state()
-                
-                if game_data.get('is_break', False):
-                    # Handle break timer
-                    break_timer = game_data.get('break_timer', 15)
-                    if break_timer > 0:
-                        game_state.update_game_state({'break_timer': break_timer - 1})
-                        socketio.emit('timer', {'time': break_timer - 1, 'isBreak': True})
-                        socketio.sleep(1)
-                    else:
-                        # Break time over, start new game
-                        game_state.reset_game()
-                        new_state = game_state.get_game_state()
-                        socketio.emit('game_status', {
-                            'status': new_state['status'],
-                            'players': new_state['players'],
-                            'timer': new_state['timer'],
-                            'isBreak': False
-                        })
-                elif game_data.get('status') == 'joining':
-                    if game_data.get('timer', 0) > 0:
-                        game_state.update_game_state({'timer': game_data['timer'] - 1})
-                        socketio.emit('timer', {'time': game_data['timer'] - 1, 'isBreak': False})
-                        
-                        if game_data['timer'] <= 1:
-                            players = game_data.get('players', [])
-                            if players:
-                                winner_idx = random.randint(0, len(players) - 1)
-                                winner = players[winner_idx]
-                                
-                                # Calculate prize
-                                total_pool = len(players) * 10
-                                winner_prize = int(total_pool * 0.8)
-                                
-                                # Update winner's wallet
-                                db.users.update_one(
-                                    {'username': winner['username']},
-                                    {'$inc': {'user_data.wallet_balance': winner_prize}}
-                                )
-                                
-                                # Record game in database
-                                db.games.insert_one({
-                                    'players': players,
-                                    'winner': winner['username'],
-                                    'total_pool': total_pool,
-                                    'winner_prize': winner_prize,
-                                    'platform_fee': total_pool - winner_prize,
-                                    'created_at': datetime.now(),
-                                    'status': 'completed',
-                                    'game_id': game_data.get('game_id')
-                                })
-                                
-                                socketio.emit('game_end', {
-                                    'winner': winner['username'],
-                                    'prize': winner_prize
-                                })
-                                
-                                # Start break time
-                                game_state.update_game_state({
-                                    'status': 'break',
-                                    'is_break': True,
-                                    'break_timer': 15
-                                })
-                                socketio.emit('game_status', {
-                                    'status': 'break',
-                                    'players': players,
-                                    'timer': 15,
-                                    'isBreak': True
-                                })
-                            else:
-                                socketio.emit('game_end', {'winner': None})
-                                game_state.reset_game()
-                                new_state = game_state.get_game_state()
-                                socketio.emit('game_status', {
-                                    'status': new_state['status'],
-                                    'players': new_state['players'],
-                                    'timer': new_state['timer'],
-                                    'isBreak': False
-                                })
+                if lease.acquire():
+                    if not leading:
+                        leading = True
+                        recover_round()
+                    tick_round()
+                else:
+                    leading = False
             
             socketio.sleep(1)
         except Exception as e:
             print(f"Timer error: {str(e)}")
             socketio.sleep(1)
 
-# Start timer thread
-timer_thread = None
+def run_archiver():
+    lease = EngineLease("archiver:leader", ttl=app.config['ARCHIVE_INTERVAL_SECONDS'] * 2)
+    indexed = False
+    while True:
+        try:
+            with app.app_context():
+                if lease.acquire():
+                    if not indexed:
+                        ensure_retention_indexes()
+                        indexed = True
+                    archive_games()
+        except Exception as e:
+            print(f"Archiver error: {str(e)}")
+        socketio.sleep(app.config['ARCHIVE_INTERVAL_SECONDS'])
+
+# Background loops run once per worker process
+background_tasks_pid = None
+
+def start_background_tasks():
+    """Start this worker's round engine and archiver if they are not running.
+
+    Hooked to every HTTP request and socket connect, so spectators polling the
+    snapshot keep rounds moving; the leases pick the one worker that does the work.
+    Both loops catch their own errors and never return.
+    """
+    global background_tasks_pid
+
+    if background_tasks_pid == os.getpid():
+        return
+    background_tasks_pid = os.getpid()
+    socketio.start_background_task(update_game_timer)
+    socketio.start_background_task(run_archiver)
 
 @socketio.on('connect')
+@instrumented('connect')
 def handle_connect():
-    global timer_thread
-    
-    if timer_thread is None or not timer_thread.is_alive():
-        timer_thread = socketio.start_background_task(update_game_timer)
-    
-    game_data = game_state.get_game_state()
-    emit('game_status', {
-        'status': game_data['status'],
-        'players': game_data['players'],
-        'timer': game_data['timer'],
-        'isBreak': game_data.get('is_break', False)
-    })
+    start_background_tasks()
+
+    if current_user.is_authenticated:
+        join_room(user_room(current_user.id))
+
+    if app.config['SOCKETIO_PACKED_EVENTS']:
+        join_room(PACKED_ROOM if wants_packed_events() else JSON_ROOM)
+
+    emit_game_status_to_client()
+
+@socketio.on('sync_game_status')
+@instrumented('sync_game_status')
+def handle_sync_game_status():
+    # Sent by a client whose roster has a gap (it missed a player_joined)
+    emit_game_status_to_client()
 
 @socketio.on('disconnect')
+@instrumented('disconnect')
 def handle_disconnect():
     print(f"Client disconnected: {request.sid}")
 
 @socketio.on('join_game')
+@instrumented('join_game')
 def handle_join_game():
     if not current_user.is_authenticated:
         emit('join_game_response', {'success': False, 'message': 'Please login first'})
         return
 
     game_data = game_state.get_game_state()
+    if 'game_id' not in game_data:
+        emit('join_game_response', {'success': False, 'message': 'No game is open yet, please try again'})
+        return
     
     # Check if player already joined
     if any(p['id'] == str(current_user.id) for p in game_data.get('players', [])):
         emit('join_game_response', {'success': False, 'message': 'Already joined the game'})
         return
 
-    # Check wallet balance
+    # Check wallet balance (the debit itself is guarded again in the batch)
     if current_user.user_data.get('wallet_balance', 0) < 10:
         emit('join_game_response', {'success': False, 'message': 'Insufficient balance'})
         return
@@ -541,108 +1632,654 @@ def handle_join_game():
         'username': current_user.user_data['username'],
         'emoji': current_user.user_data.get('emoji', '🎮')  # Default emoji if not found
     }
-    
-    game_state.update_game_state({'players': game_data.get('players', []) + [player_info]})
-
-    # Deduct entry fee
-    db.users.update_one(
-        {'_id': ObjectId(current_user.id)},
-        {'$inc': {'user_data.wallet_balance': -10}}
-    )
+    join_queue.submit(request.sid, player_info)
 
-    # Get updated game state
-    updated_game_data = game_state.get_game_state()
-
-    # Notify all clients
-    socketio.emit('game_status', {
-        'status': updated_game_data['status'],
-        'players': updated_game_data['players'],
-        'timer': updated_game_data['timer'],
-        'isBreak': updated_game_data.get('is_break', False)
-    })
+class JoinQueue:
+    """Collects join requests for a short window and applies them together:
+    one bulk wallet debit, one roster update and one broadcast per batch."""
 
-    socketio.emit('player_joined', {
-        'success': True,
-        'message': f"{player_info['username']} joined the game!",
-        'players': updated_game_data['players'],
-        'player_count': len(updated_game_data['players']),
-        'new_player': player_info
-    })
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._drainer = None
+        self.background = True  # False: the caller drains (simulator)
+
+    def submit(self, sid, player_info):
+        with self._lock:
+            self._pending.append((sid, player_info))
+            if self._drainer is None and self.background:
+                self._drainer = socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(app.config['JOIN_BATCH_WINDOW_MS'] / 1000)
+            try:
+                with app.app_context():
+                    if handler_metrics.enabled:
+                        handler_metrics.start()
+                    try:
+                        self.drain()
+                    finally:
+                        if handler_metrics.enabled:
+                            handler_metrics.stop('queue:join_batch')
+            except Exception as e:
+                print(f"Join queue error: {str(e)}")
+
+    def _reply(self, sid, success, message):
+        socketio.emit('join_game_response', {'success': success, 'message': message}, to=sid)
+
+    def drain(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        game_data = game_state.get_game_state()
+        round_id = game_data.get('game_id')
+        open_for_joins = round_id and not game_data.get('is_break') and game_data.get('status') == 'joining'
+        seen = {p['id'] for p in game_data.get('players', [])}
+
+        candidates = []
+        for sid, player in batch:
+            if not open_for_joins:
+                self._reply(sid, False, 'Game is not accepting players right now')
+            elif player['id'] in seen:
+                self._reply(sid, False, 'Already joined the game')
+            else:
+                seen.add(player['id'])
+                candidates.append((sid, player))
+        if not candidates:
+            return
+
+        # Deduct entry fees in one round trip. The guard on last_joined_game makes
+        # the debit happen at most once per user per round; the batch token tells
+        # our debits apart from those of another worker draining the same user.
+        user_ids = [ObjectId(player['id']) for _, player in candidates]
+        batch_token = str(ObjectId())
+        result = db.users.bulk_write([
+            UpdateOne(
+                {'_id': user_id, 'user_data.wallet_balance': {'$gte': 10}, 'last_joined_game': {'$ne': round_id}},
+                {'$inc': {'user_data.wallet_balance': -10},
+                 '$set': {'last_joined_game': round_id, 'join_batch': batch_token}}
+            )
+            for user_id in user_ids
+        ], ordered=False)
+        if result.modified_count == len(user_ids):
+            debited = {str(user_id) for user_id in user_ids}
+        else:
+            debited = {str(user['_id']) for user in db.users.find(
+                {'_id': {'$in': user_ids}, 'join_batch': batch_token}, {'_id': 1}
+            )}
+
+        accepted = []
+        for sid, player in candidates:
+            if player['id'] in debited:
+                accepted.append((sid, player))
+            else:
+                self._reply(sid, False, 'Insufficient balance')
+        if not accepted:
+            return
+
+        new_players = [player for _, player in accepted]
+        updated_game_data = game_state.add_players(round_id, new_players)
+        if updated_game_data is None:
+            # The round closed between the debit and the push: give the entry fees back
+            db.users.bulk_write([
+                UpdateOne(
+                    {'_id': ObjectId(player['id']), 'join_batch': batch_token},
+                    {'$inc': {'user_data.wallet_balance': 10}, '$unset': {'last_joined_game': '', 'join_batch': ''}}
+                )
+                for player in new_players
+            ], ordered=False)
+            for sid, _ in accepted:
+                self._reply(sid, False, 'Game is not accepting players right now')
+            return
+        round_events.append_many([
+            ('player_joined', round_id, {'user_id': player['id'], 'username': player['username'], 'entry_fee': 10})
+            for player in new_players
+        ])
+
+        for sid, _ in accepted:
+            self._reply(sid, True, 'Successfully joined the game')
+
+        # Notify all clients once for the whole batch; the roster is all they need
+        names = ', '.join(player['username'] for player in new_players)
+        broadcast('player_joined', {
+            'success': True,
+            'message': f"{names} joined the game!",
+            'players': updated_game_data['players'],
+            'player_count': len(updated_game_data['players']),
+            'new_player': new_players[-1],
+            'new_players': new_players
+        })
 
-    # Show wheel for first player
-    if len(updated_game_data['players']) == 1:
-        socketio.emit('show_wheel')
+join_queue = JoinQueue()
 
-    emit('join_game_response', {'success': True, 'message': 'Successfully joined the game'})
+def select_winner(game_data=None):
+    """Pick the winner of a round and pay out.
 
-def select_winner():
-    game_data = game_state.get_game_state()
-    if not game_data.get('players'):
+    Safe to run more than once for the same round: the winner is drawn from the
+    round's stored seed and every write is keyed on the round, so a settlement
+    interrupted by a crash can simply be run again.
+    """
+    if game_data is None:
+        game_data = game_state.get_game_state()
+    if not game_data.get('players') or not game_data.get('game_id'):
         return None
     
-    winner = random.choice(game_data['players'])
+    round_id = game_data['game_id']
+    winner = dict(random.Random(game_data.get('spin_seed') or round_id).choice(game_data['players']))
     total_players = len(game_data['players'])
-    prize_money = total_players * 10  # Each player contributes 10
+    total_pool = total_players * 10  # Each player contributes 10
+    prize_money = int(total_pool * 0.8)  # Winner gets 80%, platform keeps 20%
 
     try:
-        # Store game details in games collection
+        # Store game details in games collection (once per round)
         game_record = {
-            'timestamp': datetime.utcnow(),
+            'timestamp': utcnow(),
             'participants': game_data['players'],
             'participant_count': total_players,
-            'prize_pool': prize_money,
+            'prize_pool': total_pool,
             'winner': {
                 'id': winner['id'],
                 'username': winner['username'],
                 'emoji': winner['emoji']
             },
-            'entry_fee': 10
+            'entry_fee': 10,
+            'total_pool': total_pool,
+            'winner_prize': prize_money,
+            'platform_fee': total_pool - prize_money,
+            'status': 'completed',
+            'game_id': round_id
         }
-        result = db.games.insert_one(game_record)
-        game_id = result.inserted_id
+        game_record = db.games.find_one_and_update(
+            {'game_id': round_id},
+            {'$setOnInsert': game_record},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        game_id = game_record['_id']
 
         # Add game reference to each participant's history
         participant_ids = [ObjectId(p['id']) for p in game_data['players']]
+        backfill_user_stats(participant_ids)
+        history_entry = {
+            'game_id': game_id,
+            'timestamp': game_record['timestamp'],
+            'won': False,
+            'prize_pool': total_pool
+        }
         
-        # Update all participants with game record
+        # Update the other participants with game record
         db.users.update_many(
-            {'_id': {'$in': participant_ids}},
-            {'$push': {
-                'game_history': {
-                    'game_id': game_id,
-                    'timestamp': game_record['timestamp'],
-                    'won': False,
-                    'prize_pool': prize_money
+            {
+                '_id': {'$in': [user_id for user_id in participant_ids if str(user_id) != winner['id']]},
+                'game_history.game_id': {'$ne': game_id}
+            },
+            {
+                '$push': {'game_history': history_entry},
+                '$inc': {
+                    'stats.games_played': 1,
+                    'stats.entry_fees': 10,
+                    'stats.net': -10
                 }
-            }}
+            }
         )
         
-        # Update winner's game history and wallet
+        # The winner's history entry and payout are one write, so it happens
+        # exactly once however often the round is settled
         winner_update = db.users.find_one_and_update(
-            {'_id': ObjectId(winner['id'])},
+            {'_id': ObjectId(winner['id']), 'game_history.game_id': {'$ne': game_id}},
             {
-                '$set': {
-                    'game_history.$[elem].won': True
-                },
+                '$push': {'game_history': dict(history_entry, won=True)},
                 '$inc': {
-                    'user_data.wallet_balance': prize_money
+                    'user_data.wallet_balance': prize_money,
+                    'stats.games_played': 1,
+                    'stats.entry_fees': 10,
+                    'stats.wins': 1,
+                    'stats.earnings': prize_money,
+                    'stats.net': prize_money - 10
                 }
             },
-            array_filters=[{'elem.game_id': game_id}],
-            return_document=True
+            return_document=ReturnDocument.AFTER
         )
+        winner['prize'] = prize_money
+
+        if winner_update is None:
+            print(f"Game {round_id} was already paid out")
+            winner_update = db.users.find_one({'_id': ObjectId(winner['id'])})
 
         # Add wallet balance to winner data for frontend
         winner['wallet_balance'] = winner_update['user_data']['wallet_balance']
-        winner['prize'] = prize_money
+
+        run_settlement_effects(game_record, game_data['players'], winner)
 
         print(f"Game completed - Winner: {winner['username']}, Prize: {prize_money}")
         return winner
 
     except Exception as e:
-        print(f"Error in select_winner: {str(e)}")
+        # Leave the round open: the next tick or recover_round settles it again
+        app.logger.error(f"Settlement of round {round_id} failed: {str(e)}")
+        raise
+
+def run_settlement_effects(game_record, players, winner):
+    """Record a paid-out game on the leaderboards, the event stream and in notifications.
+
+    Each step is flagged on the games record once it has run, so a settlement
+    retried after a crash runs only the steps that had not finished yet.
+    """
+    game_id = game_record['_id']
+    round_id = game_record['game_id']
+    prize_money = game_record['winner_prize']
+
+    def record_events():
+        round_events.append_many([
+            ('winner', round_id, {'user_id': winner['id'], 'username': winner['username'],
+                                  'participant_count': game_record['participant_count']}),
+            ('payout', round_id, {'user_id': winner['id'], 'amount': prize_money,
+                                  'platform_fee': game_record['platform_fee'], 'record_id': str(game_id)})
+        ])
+
+    def notify_players():
+        for player in players:
+            if player['id'] == winner['id']:
+                notification_outbox.enqueue(player['id'], 'round_won',
+                                            f"You won ₹{prize_money}!",
+                                            {'game_id': str(game_id), 'prize': prize_money})
+            else:
+                notification_outbox.enqueue(player['id'], 'round_lost',
+                                            f"{winner['username']} won this round. Better luck next time!",
+                                            {'game_id': str(game_id)})
+
+    steps = (
+        ('leaderboard', lambda: leaderboard.record_round(compact_game(game_record), players)),
+        ('events', record_events),
+        ('notifications', notify_players)
+    )
+    done = game_record.get('side_effects', {})
+    for step, run in steps:
+        if not done.get(step):
+            run()
+            db.games.update_one({'_id': game_id}, {'$set': {f"side_effects.{step}": True}})
+
+def refund_round(game_data):
+    """Give every player their entry fee back. Idempotent per round."""
+    round_id = game_data['game_id']
+    refunded = []
+    backfill_user_stats([ObjectId(player['id']) for player in game_data.get('players', [])])
+    for player in game_data.get('players', []):
+        result = db.users.update_one(
+            {'_id': ObjectId(player['id']), 'refunded_games': {'$ne': round_id}},
+            {
+                '$inc': {'user_data.wallet_balance': 10, 'stats.refunds': 10},
+                '$push': {'refunded_games': {'$each': [round_id], '$slice': -50}}
+            }
+        )
+        if result.modified_count:
+            refunded.append(player)
+            notification_outbox.enqueue(player['id'], 'round_refunded',
+                                        "Not enough players joined. Your ₹10 entry fee has been refunded.",
+                                        {'game_id': round_id, 'amount': 10})
+    round_events.append_many([
+        ('refund', round_id, {'user_id': player['id'], 'amount': 10, 'round_refunded': True})
+        for player in refunded
+    ])
+    return refunded
+
+def settle_round(game_data):
+    """Close a round: a winner needs at least two players, otherwise entries are refunded."""
+    players = game_data.get('players', [])
+    if len(players) >= 2:
+        return select_winner(game_data)
+    if players:
+        refund_round(game_data)
+    return None
+
+# Retention and archival. game_history only holds transient round state and
+# expires via a TTL index; completed games older than ARCHIVE_AFTER_DAYS are
+# rolled into one compressed summary document per day in games_archive.
+def ensure_retention_indexes():
+    ttl = app.config['GAME_HISTORY_TTL_DAYS'] * 86400
+    try:
+        db.game_history.create_index('created_at', expireAfterSeconds=ttl)
+    except OperationFailure:
+        # TTL changed since the index was created
+        db.command('collMod', 'game_history', index={'keyPattern': {'created_at': 1}, 'expireAfterSeconds': ttl})
+    db.game_history.create_index('game_id')
+    db.games.create_index('game_id')
+    db.games.create_index('timestamp')
+
+def game_time(game):
+    # Games written by the old timer loop only have created_at
+    return as_utc(game.get('timestamp') or game['created_at'])
+
+def day_key(moment):
+    return moment.strftime('%Y-%m-%d')
+
+def compact_game(game):
+    winner = game.get('winner')
+    if not isinstance(winner, dict):
+        winner = {'id': None, 'username': winner, 'emoji': None}
+    participants = game.get('participants') or game.get('players') or []
+    return {
+        'id': str(game['_id']),
+        'game_id': game.get('game_id'),
+        'timestamp': game_time(game).isoformat(),
+        'participants': [p['id'] for p in participants],
+        'participant_count': game.get('participant_count', len(participants)),
+        'total_pool': game.get('total_pool', game.get('prize_pool', 0)),
+        'winner_prize': game.get('winner_prize', 0),
+        'platform_fee': game.get('platform_fee', 0),
+        'winner': {'id': str(winner['id']) if winner['id'] else None,
+                   'username': winner['username'], 'emoji': winner['emoji']},
+        'status': game.get('status')
+    }
+
+def archive_day(day, games):
+    games = sorted(games, key=lambda game: game['_id'])
+    compacted = [compact_game(game) for game in games]
+    completed = [game for game in compacted if game['status'] == 'completed']
+    chunk = {
+        # archive_games slices whole days in _id order, so a re-run after an
+        # interruption rebuilds the same chunk and the guard below skips its counters
+        'chunk_id': f"{compacted[0]['id']}-{compacted[-1]['id']}",
+        'count': len(compacted),
+        'data': Binary(zlib.compress(json.dumps(compacted, separators=(',', ':')).encode('utf-8'), 9))
+    }
+    try:
+        db.games_archive.update_one(
+            {'_id': day_key(day), 'chunks.chunk_id': {'$ne': chunk['chunk_id']}},
+            {
+                '$setOnInsert': {'day': day},
+                '$inc': {
+                    'game_count': len(completed),
+                    'total_pool': sum(game['total_pool'] for game in completed),
+                    'winner_prizes': sum(game['winner_prize'] for game in completed),
+                    'platform_fees': sum(game['platform_fee'] for game in completed),
+                    'participants': sum(game['participant_count'] for game in completed)
+                },
+                '$push': {'chunks': chunk}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # Chunk already archived by an earlier run that stopped before deleting
+
+    db.games.delete_many({'_id': {'$in': [game['_id'] for game in games]}})
+
+def archive_games(batch_size=1000):
+    """Move completed games older than the cutoff into per-day archive documents."""
+    today = utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - timedelta(days=app.config['ARCHIVE_AFTER_DAYS'])
+    old_games = {'$or': [
+        {'timestamp': {'$lt': cutoff}},
+        {'timestamp': {'$exists': False}, 'created_at': {'$lt': cutoff}}
+    ]}
+
+    archived = 0
+    while True:
+        oldest = db.games.find_one(old_games, sort=[('_id', 1)])
+        if not oldest:
+            break
+        # Always archive a whole day: a chunk cut from a partial day would get
+        # a different chunk_id on the next run and its games counted twice
+        day = game_time(oldest).replace(hour=0, minute=0, second=0, microsecond=0)
+        next_day = day + timedelta(days=1)
+        games = list(db.games.find({'$or': [
+            {'timestamp': {'$gte': day, '$lt': next_day}},
+            {'timestamp': {'$exists': False}, 'created_at': {'$gte': day, '$lt': next_day}}
+        ]}).sort('_id', 1))
+        for start in range(0, len(games), batch_size):
+            archive_day(day, games[start:start + batch_size])
+        archived += len(games)
+
+    if archived:
+        app.logger.info(f"Archived {archived} games older than {day_key(cutoff)}")
+    return archived
+
+def load_archived_games(day, game_ids=None):
+    summary = read_db('history').games_archive.find_one({'_id': day})
+    if not summary:
+        return None, []
+    games = []
+    for chunk in summary.get('chunks', []):
+        for game in json.loads(zlib.decompress(chunk['data'])):
+            if game_ids is None or game['id'] in game_ids:
+                games.append(game)
+    return summary, games
+
+@app.route('/api/games/archive/<day>', methods=['GET'])
+def get_archived_games(day):
+    summary, games = load_archived_games(day)
+    if not summary:
+        return jsonify({'error': 'No archive for this day'}), 404
+    return jsonify({
+        'day': day,
+        'game_count': summary['game_count'],
+        'total_pool': summary['total_pool'],
+        'winner_prizes': summary['winner_prizes'],
+        'platform_fees': summary['platform_fees'],
+        'games': games
+    })
+
+# Leaderboards: Redis sorted sets per metric and period, updated incrementally at
+# settlement. Members are user ids; display names live in one hash.
+class Leaderboard:
+    METRICS = ('winnings', 'wins', 'rounds')
+    PERIODS = ('today', 'week', 'all')
+
+    def __init__(self, push_size=10):
+        self.prefix = "leaderboard"
+        self.names_key = "leaderboard:names"
+        self.push_size = push_size
+        self._last_pushed = {}
+
+    def _period_key(self, period, moment):
+        if period == 'today':
+            return f"day:{moment.strftime('%Y-%m-%d')}"
+        if period == 'week':
+            year, week, _ = moment.isocalendar()
+            return f"week:{year}-W{week:02d}"
+        return 'all'
+
+    def _period_end(self, period, moment):
+        day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        if period == 'today':
+            return day + timedelta(days=1)
+        if period == 'week':
+            return day + timedelta(days=7 - day.weekday())
         return None
 
+    def key(self, metric, period, moment=None):
+        return f"{self.prefix}:{metric}:{self._period_key(period, moment or utcnow())}"
+
+    def _record(self, pipe, game, moment):
+        winner_id = game['winner']['id']
+        for period in self.PERIODS:
+            keys = {metric: self.key(metric, period, moment) for metric in self.METRICS}
+            for user_id in game['participants']:
+                pipe.zincrby(keys['rounds'], 1, user_id)
+            if winner_id:
+                pipe.zincrby(keys['wins'], 1, winner_id)
+                pipe.zincrby(keys['winnings'], game['winner_prize'], winner_id)
+            period_end = self._period_end(period, moment)
+            if period_end:
+                # Keep finished periods for a day, then let Redis drop them
+                for key in keys.values():
+                    pipe.expireat(key, period_end + timedelta(days=1))
+
+    def record_round(self, game, players=()):
+        """Add a settled game (as produced by compact_game) to every board."""
+        if not redis_available():
+            return
+        try:
+            pipe = redis_game.pipeline(transaction=False)
+            self._record(pipe, game, as_utc(game['timestamp']))
+            for player in players:
+                pipe.hset(self.names_key, player['id'],
+                          json.dumps({'username': player['username'], 'emoji': player.get('emoji')}))
+            pipe.execute()
+            self.push_changes()
+        except redis.RedisError as e:
+            app.logger.error(f"Leaderboard update failed: {str(e)}")
+
+    def push_changes(self):
+        # Tell clients only when the visible top of a winnings board changed
+        for period in self.PERIODS:
+            leaders = self.top('winnings', period, self.push_size)
+            if leaders != self._last_pushed.get(period):
+                self._last_pushed[period] = leaders
+                socketio.emit('leaderboard_update', {'metric': 'winnings', 'period': period, 'leaders': leaders})
+
+    def _names(self, user_ids):
+        names = dict(zip(user_ids, redis_game.hmget(self.names_key, user_ids))) if user_ids else {}
+        missing = [user_id for user_id, name in names.items() if name is None]
+        if missing:
+            users = read_db('history').users.find(
+                {'_id': {'$in': [ObjectId(user_id) for user_id in missing]}},
+                {'user_data.username': 1, 'user_data.emoji': 1}
+            )
+            for user in users:
+                name = json.dumps({'username': user['user_data']['username'],
+                                   'emoji': user['user_data'].get('emoji')})
+                names[str(user['_id'])] = name
+                redis_game.hset(self.names_key, str(user['_id']), name)
+        return {user_id: json.loads(name) if name else {'username': 'Unknown', 'emoji': None}
+                for user_id, name in names.items()}
+
+    def top(self, metric, period, limit=10):
+        entries = [(_text(member), score) for member, score in
+                   redis_game.zrevrange(self.key(metric, period), 0, limit - 1, withscores=True)]
+        names = self._names([user_id for user_id, _ in entries])
+        return [{'rank': rank, 'user_id': user_id, 'score': int(score), **names[user_id]}
+                for rank, (user_id, score) in enumerate(entries, start=1)]
+
+    def rank(self, user_id, metric, period):
+        pipe = redis_game.pipeline(transaction=False)
+        pipe.zrevrank(self.key(metric, period), user_id)
+        pipe.zscore(self.key(metric, period), user_id)
+        rank, score = pipe.execute()
+        if rank is None:
+            return None
+        return {'rank': rank + 1, 'score': int(score)}
+
+    def rebuild(self, batch_size=500):
+        """Recompute every board from MongoDB (hot games and the archive)."""
+        for key in redis_game.scan_iter(match=f"{self.prefix}:*", count=1000):
+            if _text(key) != self.names_key:
+                redis_game.delete(key)
+        pipe = redis_game.pipeline(transaction=False)
+        count = 0
+        for game in iter_settled_games():
+            self._record(pipe, game, as_utc(game['timestamp']))
+            count += 1
+            if count % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        self._last_pushed.clear()
+        return count
+
+leaderboard = Leaderboard()
+
+def iter_settled_games():
+    history = read_db('history')
+    for game in history.games.find({'status': 'completed'}):
+        yield compact_game(game)
+    for summary in history.games_archive.find({}, {'_id': 1}):
+        for game in load_archived_games(summary['_id'])[1]:
+            if game['status'] == 'completed':
+                yield game
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    metric = request.args.get('metric', 'winnings')
+    period = request.args.get('period', 'all')
+    if metric not in Leaderboard.METRICS or period not in Leaderboard.PERIODS:
+        return jsonify({'error': 'Invalid metric or period'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    if not redis_available():
+        return jsonify({'error': 'Leaderboard unavailable'}), 503
+
+    try:
+        response = {
+            'metric': metric,
+            'period': period,
+            'leaders': leaderboard.top(metric, period, limit)
+        }
+        if current_user.is_authenticated:
+            response['me'] = leaderboard.rank(current_user.id, metric, period)
+        return jsonify(response)
+    except redis.RedisError as e:
+        app.logger.error(f"Leaderboard read failed: {str(e)}")
+        return jsonify({'error': 'Leaderboard unavailable'}), 503
+
+@app.cli.command('rebuild-leaderboard')
+def rebuild_leaderboard_command():
+    """Rebuild all leaderboards from MongoDB."""
+    click.echo(f"Rebuilt leaderboards from {leaderboard.rebuild()} games")
+
+@app.cli.command('measure-encoding')
+@click.option('--players', default=20, help='Players in the sample round.')
+@click.option('--repeat', default=10000, help='Encodings timed per event.')
+def measure_encoding_command(players, repeat):
+    """Compare wire size and encode time of JSON and packed round broadcasts."""
+    roster = [{'id': str(ObjectId()), 'username': f"player{i}", 'emoji': '🎮'} for i in range(players)]
+    samples = {
+        'game_status': {'status': 'joining', 'players': roster, 'timer': 245, 'isBreak': False},
+        'player_joined': {'success': True, 'message': f"player{players - 1} joined the game!", 'players': roster,
+                          'player_count': players, 'new_player': roster[-1], 'new_players': roster[-1:]}
+    }
+    for event, data in samples.items():
+        # Socket.IO frames: a JSON event is one text packet; a packed one is a
+        # text header with a placeholder plus a binary attachment
+        started = time.perf_counter()
+        for _ in range(repeat):
+            text = json.dumps([event, data], separators=(',', ':'))
+        json_us = (time.perf_counter() - started) / repeat * 1e6
+        started = time.perf_counter()
+        for _ in range(repeat):
+            packed = pack_event(event, data)
+        packed_us = (time.perf_counter() - started) / repeat * 1e6
+
+        json_bytes = len(text.encode())
+        packed_bytes = len(json.dumps([event, {'_placeholder': True, 'num': 0}], separators=(',', ':'))) + len(packed)
+        click.echo(f"{event:<14} json {json_bytes:>6}B {json_us:>6.1f}us   "
+                   f"packed {packed_bytes:>6}B {packed_us:>6.1f}us   {1 - packed_bytes / json_bytes:>4.0%} smaller")
+
+@app.cli.command('archive-games')
+def archive_games_command():
+    """Create retention indexes and archive games past the cutoff."""
+    ensure_retention_indexes()
+    click.echo(f"Archived {archive_games()} games")
+
+@app.route('/static/dist/<path:filename>')
+def static_asset(filename):
+    """Serve a fingerprinted asset, precompressed when the client accepts it.
+
+    The name changes whenever the content does, so the response is immutable
+    and a CDN in front (ASSET_URL_PREFIX) only ever fetches it once.
+    """
+    directory = os.path.join(app.static_folder, 'dist')
+    mimetype = mimetypes.guess_type(filename)[0]
+    # max_age makes send_file mark the response public instead of no-cache
+    max_age = 365 * 24 * 3600
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        compressed = safe_join(directory, filename + suffix)
+        if request.accept_encodings[encoding] and compressed and os.path.isfile(compressed):
+            response = send_from_directory(directory, filename + suffix, mimetype=mimetype, max_age=max_age)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype, max_age=max_age)
+
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -670,6 +2307,7 @@ def register():
                 'emoji': selected_emoji
             },
             'game_history': [],
+            'stats': {field: 0 for field in USER_STATS_FIELDS},
             'is_admin': False,
             'is_blocked': False,
             'created_at': datetime.utcnow(),
@@ -738,7 +2376,7 @@ def game():
 @login_required
 def wallet():
     # Get user's transactions
-    transactions = list(db.transactions.find(
+    transactions = list(read_db('history').transactions.find(
         {'user_id': ObjectId(current_user.id)}
     ).sort('created_at', -1))
     
@@ -775,6 +2413,7 @@ def request_deposit():
     }
     
     db.transactions.insert_one(transaction)
+    read_own_writes()
     flash('Deposit request submitted successfully! Admin will verify and update your balance.')
     return redirect(url_for('wallet'))
 
@@ -819,6 +2458,7 @@ def request_withdrawal():
     )
     
     db.transactions.insert_one(transaction)
+    read_own_writes()
     flash('Withdrawal request submitted successfully!')
     return redirect(url_for('wallet'))
 
@@ -840,11 +2480,12 @@ def admin():
         return redirect(url_for('game'))
 
     # Get recent transactions
-    transactions = list(db.transactions.find().sort('created_at', -1).limit(50))
+    dashboard = read_db('dashboard')
+    transactions = list(dashboard.transactions.find().sort('created_at', -1).limit(50))
 
     # Get all users with proper last_active field
     users = []
-    for user in db.users.find():
+    for user in dashboard.users.find():
         # Convert last_active to datetime if it exists
         if 'last_active' in user:
             try:
@@ -855,17 +2496,27 @@ def admin():
             user['last_active'] = None
         users.append(user)
 
-    # Calculate platform earnings (20% of total pool from completed games)
-    total_pool = sum(game.get('total_pool', 0) for game in db.games.find({'status': 'completed'}))
+    # Calculate platform earnings (20% of total pool from completed games),
+    # including games that have been rolled into the archive
+    totals = {'games': 0, 'total_pool': 0}
+    for collection, match, count in ((dashboard.games, {'status': 'completed'}, 1),
+                                     (dashboard.games_archive, {}, '$game_count')):
+        for row in collection.aggregate([
+            {'$match': match},
+            {'$group': {'_id': None, 'games': {'$sum': count}, 'total_pool': {'$sum': '$total_pool'}}}
+        ]):
+            totals['games'] += row['games']
+            totals['total_pool'] += row['total_pool']
+    total_pool = totals['total_pool']
     platform_earnings = int(total_pool * 0.2) if total_pool else 0
 
     # Calculate stats
     week_ago = datetime.now() - timedelta(days=7)
     stats = {
-        'total_games': db.games.count_documents({'status': 'completed'}),
-        'total_players': db.users.count_documents({}),
+        'total_games': totals['games'],
+        'total_players': dashboard.users.count_documents({}),
         'platform_earnings': platform_earnings,
-        'active_players': db.users.count_documents({
+        'active_players': dashboard.users.count_documents({
             'last_active': {'$gte': week_ago}
         })
     }
@@ -947,6 +2598,10 @@ def handle_transaction(action, transaction_id):
                     app.logger.error(f"Error approving deposit: {str(e)}")
                     raise
             
+            notification_outbox.enqueue(transaction['user_id'], f"{transaction['type']}_approved",
+                                        f"Your {transaction['type']} of ₹{transaction['amount']} was approved",
+                                        {'transaction_id': transaction_id, 'amount': transaction['amount']})
+            
             return jsonify({'success': True, 'message': 'Transaction approved'})
         
         elif action == 'reject':
@@ -982,6 +2637,13 @@ def handle_transaction(action, transaction_id):
                 app.logger.error(f"Error updating transaction status: {str(e)}")
                 raise
             
+            if transaction['type'] == 'withdrawal':
+                message = f"Your withdrawal of ₹{transaction['amount']} was rejected and refunded to your wallet"
+            else:
+                message = f"Your deposit of ₹{transaction['amount']} was rejected"
+            notification_outbox.enqueue(transaction['user_id'], f"{transaction['type']}_rejected", message,
+                                        {'transaction_id': transaction_id, 'amount': transaction['amount']})
+            
             return jsonify({'success': True, 'message': 'Transaction rejected'})
         
         app.logger.error(f"Invalid action: {action}")
@@ -991,6 +2653,40 @@ def handle_transaction(action, transaction_id):
         app.logger.error(f"Transaction handling error: {str(e)}")
         return jsonify({'success': False, 'message': f'An error occurred: {str(e)}'})
 
+@app.route('/admin/metrics', methods=['GET', 'DELETE'])
+@login_required
+@admin_required
+def handler_metrics_view():
+    if request.method == 'DELETE':
+        handler_metrics.reset()
+    return jsonify({
+        'enabled': handler_metrics.enabled,
+        'worker': os.getpid(),
+        'handlers': handler_metrics.snapshot()
+    })
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def profiler_view():
+    if request.method == 'POST':
+        try:
+            seconds = int(request.args.get('seconds', 30))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid duration'}), 400
+        seconds = min(max(seconds, 1), app.config['PROFILE_MAX_SECONDS'])
+        if not profiler.start(seconds, app.config['PROFILE_INTERVAL_MS'], app.config['PROFILE_DIR']):
+            return jsonify({'success': False, 'message': 'Profiler already running'}), 409
+
+    return jsonify({
+        'success': True,
+        'worker': os.getpid(),
+        'running': profiler.running,
+        'started_at': profiler.started_at.isoformat() if profiler.started_at else None,
+        'seconds': profiler.seconds,
+        'output': profiler.output
+    })
+
 @app.route('/admin/user/<action>/<user_id>', methods=['POST'])
 @login_required
 @admin_required
@@ -1015,10 +2711,27 @@ def handle_user(action, user_id):
     
     return jsonify({'success': False, 'message': 'Invalid action'})
 
+@app.cli.command('replay-round')
+@click.argument('game_id')
+def replay_round_command(game_id):
+    """Print every recorded event of a round in order."""
+    for event in round_events.replay(game_id):
+        click.echo(json_dumps(event))
+
+@app.cli.command('forward-round-events')
+def forward_round_events_command():
+    """Copy events stored in MongoDB during a Redis outage into the Redis stream."""
+    click.echo(f"Forwarded {round_events.forward_fallback()} events")
+
+@app.cli.command('round-stats')
+def round_stats_command():
+    """Rebuild aggregate round statistics from the event stream."""
+    click.echo(json.dumps(round_events.rebuild_stats(), indent=2))
+
 game_state = GameState()
 
 if __name__ == '__main__':
     try:
-        socketio.run(app, debug=True, allow_unsafe_werkzeug=True)
+        socketio.run(create_app(), debug=True, allow_unsafe_werkzeug=True)
     except Exception as e:
         print(f"Server Error: {str(e)}")
@@ -0,0 +1,91 @@
+"""Fingerprint and precompress static assets.
+
+Copies every file under static/ to static/dist/ with a content hash in its
+name (css/wheel.css -> css/wheel.<hash>.css), writes gzip and, when the
+brotli package is installed, brotli variants of text assets next to it, and
+records the mapping in static/dist/manifest.json for asset_url().
+
+    python build_assets.py
+
+Run it as part of every deploy (bin/post_compile does on Heroku); output is
+deterministic, so unchanged files keep their names and stay cached.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC = os.path.join(ROOT, 'static')
+DIST = os.path.join(STATIC, 'dist')
+
+# Images are already compressed; only text assets get .gz/.br variants
+COMPRESSIBLE = {'.js', '.css', '.svg', '.json', '.txt', '.html', '.map'}
+
+
+def source_files():
+    for directory, subdirectories, files in os.walk(STATIC):
+        if os.path.abspath(directory) == DIST:
+            subdirectories[:] = []
+            continue
+        subdirectories.sort()
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            yield os.path.relpath(path, STATIC).replace(os.sep, '/'), path
+
+
+def build():
+    if os.path.isdir(DIST):
+        shutil.rmtree(DIST)
+
+    manifest = {}
+    original_total = compressed_total = 0
+    for name, path in source_files():
+        with open(path, 'rb') as f:
+            content = f.read()
+        stem, ext = os.path.splitext(name)
+        fingerprinted = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+        target = os.path.join(DIST, fingerprinted)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+
+        sizes = [f"{len(content)}B"]
+        if ext in COMPRESSIBLE:
+            # mtime=0 keeps the .gz bytes identical between builds
+            gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+            with open(target + '.gz', 'wb') as f:
+                f.write(gzipped)
+            sizes.append(f"gzip {len(gzipped)}B")
+            smallest = len(gzipped)
+            if brotli:
+                brotlied = brotli.compress(content, quality=11)
+                with open(target + '.br', 'wb') as f:
+                    f.write(brotlied)
+                sizes.append(f"br {len(brotlied)}B")
+                smallest = min(smallest, len(brotlied))
+            original_total += len(content)
+            compressed_total += smallest
+
+        manifest[name] = fingerprinted
+        print(f"{name} -> dist/{fingerprinted} ({', '.join(sizes)})")
+
+    with open(os.path.join(DIST, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    if not brotli:
+        print("brotli not installed, wrote gzip variants only")
+    if original_total:
+        print(f"Text assets: {original_total}B -> {compressed_total}B precompressed")
+    return manifest
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,264 @@
+"""Round simulator.
+
+Drives the real round engine (tick_round, the join queue, settlement, refunds
+and recovery) on a virtual clock, so a round takes milliseconds instead of 315
+seconds. At the end it checks that money is conserved and reports the time
+spent in each phase and the rounds per second.
+
+With --in-memory the database work dominates: mongomock scans a collection
+for every query, so expect roughly 10-20 rounds/s (2000 rounds in about three
+minutes) rather than the rate against a real MongoDB.
+
+    python simulate.py --rounds 2000
+    python simulate.py --mongo-uri mongodb://localhost:27017 --redis-url redis://localhost:6379/15
+    python simulate.py --in-memory      # uses mongomock and fakeredis, no servers needed
+
+The simulator drops and recreates its own database (wheel_sim by default) and
+refuses to run against the production database name.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+from bson import ObjectId
+
+import app as wheel
+
+
+class VirtualClock:
+    def __init__(self, start=None):
+        self.current = start or datetime.now(timezone.utc)
+
+    def now(self):
+        return self.current
+
+    def advance_to(self, moment):
+        self.current = max(self.current, wheel.as_utc(moment))
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.phases = {}
+
+    def measure(self, phase, f, *args):
+        started = time.perf_counter()
+        try:
+            return f(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            stat = self.phases.setdefault(phase, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] = max(stat[2], elapsed)
+
+    def report(self):
+        print(f"{'phase':<10} {'count':>7} {'total ms':>10} {'avg ms':>8} {'max ms':>8} {'per sec':>9}")
+        for phase, (count, total, longest) in self.phases.items():
+            per_second = count / total if total else float('inf')
+            print(f"{phase:<10} {count:>7} {total * 1000:>10.1f} {total / count * 1000:>8.3f} "
+                  f"{longest * 1000:>8.3f} {per_second:>9.0f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--max-players', type=int, default=20)
+    parser.add_argument('--crash-rate', type=float, default=0.05,
+                        help='Probability that the engine is killed during a round')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--mongo-uri', default=os.getenv('SIM_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mongo-db', default='wheel_sim')
+    parser.add_argument('--redis-url', default=None,
+                        help='Redis to use for game state (use a spare database number), or memory://')
+    parser.add_argument('--in-memory', action='store_true',
+                        help='Use mongomock and fakeredis instead of MongoDB and Redis servers')
+    args = parser.parse_args()
+    if args.in_memory and not args.redis_url:
+        # mongomock has no capped collections, so the event stream needs Redis
+        args.redis_url = 'memory://'
+    return args
+
+
+def connect(args):
+    if args.mongo_db == wheel.Config.MONGO_DB:
+        raise SystemExit(f"Refusing to simulate against the production database '{args.mongo_db}'")
+
+    # Configure without Redis first so Socket.IO gets no message queue: the
+    # simulator's broadcasts have no listeners and must not reach real clients
+    wheel.create_app({
+        'MONGO_URI': args.mongo_uri,
+        'MONGO_DB': args.mongo_db,
+        'REDIS_HOST': None,
+        'SOCKETIO_MESSAGE_QUEUE': None,
+        'MONGO_READ_FROM_SECONDARIES': False
+    })
+
+    mongo = None
+    if args.in_memory:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("--in-memory needs mongomock (pip install mongomock)")
+        mongo = mongomock.MongoClient()
+
+    redis_client = None
+    if args.redis_url == 'memory://':
+        try:
+            import fakeredis
+        except ImportError:
+            raise SystemExit("--redis-url memory:// needs fakeredis (pip install fakeredis)")
+        redis_client = fakeredis.FakeRedis()
+        wheel.app.config['REDIS_HOST'] = 'memory'
+    elif args.redis_url:
+        url = urlparse(args.redis_url)
+        wheel.app.config.update(
+            REDIS_HOST=url.hostname,
+            REDIS_PORT=url.port or 6379,
+            REDIS_PASSWORD=url.password,
+            REDIS_DB=int(url.path.lstrip('/') or 0)
+        )
+
+    wheel.connections.use_clients(mongo=mongo, redis_client=redis_client)
+    wheel.connections.mongo_client().drop_database(args.mongo_db)
+    if wheel.redis_available():
+        wheel.redis_game.delete(wheel.game_state.game_key)
+
+    # The simulator drains and flushes itself, on the virtual clock
+    wheel.join_queue.background = False
+    wheel.notification_outbox.background = False
+
+
+def create_users(rng, count):
+    users = []
+    for i in range(count):
+        users.append({
+            '_id': ObjectId(),
+            'username': f"sim{i}",
+            'user_data': {'username': f"sim{i}", 'wallet_balance': rng.choice([0, 10, 50, 200, 1000]), 'emoji': '🎮'},
+            'game_history': [],
+            'stats': {field: 0 for field in wheel.USER_STATS_FIELDS},
+            'is_admin': False,
+            'is_blocked': False
+        })
+    wheel.db.users.insert_many(users)
+    return users
+
+
+def drop_cached_state():
+    # A killed engine leaves Redis either stale or expired; recovery must not care
+    if wheel.redis_available():
+        wheel.redis_game.delete(wheel.game_state.game_key)
+
+
+def play_round(rng, clock, timer, users, args, outcomes):
+    state = wheel.game_state.get_game_state()
+    deadline = wheel.as_utc(state['ends_at'])
+
+    # Joins arrive in a few bursts spread over the joining phase
+    joiners = rng.sample(users, rng.randint(0, min(args.max_players, len(users))))
+    bursts = rng.randint(1, 4)
+    for burst in range(bursts):
+        clock.advance_to(deadline - timedelta(seconds=(wheel.ROUND_SECONDS - 10) * (1 - (burst + 1) / (bursts + 1))))
+        for user in joiners[burst::bursts]:
+            wheel.join_queue.submit(f"sim-{user['_id']}", {
+                'id': str(user['_id']),
+                'username': user['username'],
+                'emoji': '🎮'
+            })
+        timer.measure('join', wheel.join_queue.drain)
+        timer.measure('tick', wheel.tick_round)
+
+    crash = rng.random() < args.crash_rate and rng.choice(['joining', 'expired', 'partial'])
+    if crash == 'joining':
+        drop_cached_state()
+        outcomes[timer.measure('recover', wheel.recover_round)] += 1
+        crash = None
+
+    clock.advance_to(deadline)
+    if crash == 'expired':
+        # Engine was down when the deadline passed
+        drop_cached_state()
+        outcomes[timer.measure('recover', wheel.recover_round)] += 1
+    elif crash == 'partial':
+        # Engine died after paying out but before moving the round to the break
+        wheel.settle_round(wheel.game_state.get_game_state())
+        drop_cached_state()
+        outcomes[timer.measure('recover', wheel.recover_round)] += 1
+    else:
+        timer.measure('settle', wheel.tick_round)
+
+    state = wheel.game_state.get_game_state()
+    if state.get('is_break'):
+        clock.advance_to(state['break_ends_at'])
+        timer.measure('reset', wheel.tick_round)
+    timer.measure('flush', wheel.notification_outbox.flush)
+
+
+def check_money(initial_balances):
+    users = {user['_id']: user for user in wheel.db.users.find({'_id': {'$in': list(initial_balances)}})}
+    games = list(wheel.db.games.find())
+
+    # What actually moved: rosters were debited, and prizes and refunds are
+    # counted in stats by the same write that credits the wallet
+    entry_fees = sum(len(r.get('players', [])) * 10 for r in wheel.db.game_history.find())
+    prizes = sum(user['stats']['earnings'] for user in users.values())
+    refunds = sum(user['stats']['refunds'] for user in users.values())
+    wallet_change = sum(user['user_data']['wallet_balance'] for user in users.values()) - sum(initial_balances.values())
+    platform_fees = sum(game['platform_fee'] for game in games)
+
+    checks = {
+        'wallets changed by prizes + refunds - entry fees': wallet_change == prizes + refunds - entry_fees,
+        'every settled game paid its prize': prizes == sum(game['winner_prize'] for game in games),
+        'house kept exactly the platform fees': entry_fees - prizes - refunds == platform_fees,
+        'no negative balances': all(user['user_data']['wallet_balance'] >= 0 for user in users.values()),
+        'one games record per settled round': len(games) == len({game['game_id'] for game in games}),
+        'entry fees counted once per settled player': (
+            sum(user['stats']['entry_fees'] for user in users.values())
+            == sum(game['participant_count'] * 10 for game in games)
+        )
+    }
+
+    print(f"entry fees {entry_fees}, prizes paid {prizes}, refunds {refunds}, platform fees {platform_fees}, "
+          f"wallet change {wallet_change}")
+    for name, ok in checks.items():
+        print(f"  [{'ok' if ok else 'FAIL'}] {name}")
+    return all(checks.values())
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+
+    connect(args)
+    clock = VirtualClock()
+    wheel.utcnow = clock.now
+
+    with wheel.app.app_context():
+        users = create_users(rng, args.users)
+        initial_balances = {user['_id']: user['user_data']['wallet_balance'] for user in users}
+
+        timer = PhaseTimer()
+        outcomes = {'none': 0, 'resumed': 0, 'settled': 0, 'refunded': 0, 'break': 0}
+        wheel.tick_round()  # Opens the first round
+
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            play_round(rng, clock, timer, users, args, outcomes)
+        elapsed = time.perf_counter() - started
+
+        print(f"Simulated {args.rounds} rounds ({args.rounds * (wheel.ROUND_SECONDS + wheel.BREAK_SECONDS) / 3600:.1f} "
+              f"virtual hours) in {elapsed:.2f}s: {args.rounds / elapsed:.0f} rounds/s")
+        print(f"Recoveries: {', '.join(f'{k} {v}' for k, v in outcomes.items() if v)}")
+        timer.report()
+        ok = check_money(initial_balances)
+
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
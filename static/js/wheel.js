@@ -1,23 +1,90 @@
 class WheelGame {
     constructor() {
-        this.socket = io();
+        // Spectators poll the cacheable snapshot; a socket is only opened
+        // once the user joins (or is already playing in this round)
+        this.socket = null;
         this.players = [];
         this.isBreakTime = false;
         this.gameStatus = 'joining';
+        this.deadline = null;
+        this.clockOffset = 0;
+        this.lastWinnerGame = null;
+        this.rosterKey = null;
+        this.rotation = 0;
         this.setupElements();
-        this.setupSocketListeners();
-        this.initializeGrid();
-        this.createPopupElements();
+        this.renderSegments();
+        this.drawWheel();
+        this.startSpectating();
         
         console.log('WheelGame initialized');
     }
 
-    createPopupElements() {
-        // Create grid expansion notice
-        const notice = document.createElement('div');
-        notice.className = 'grid-expansion-notice';
-        this.wheelContainer.appendChild(notice);
-        this.expansionNotice = notice;
+    startSpectating() {
+        this.pollSnapshot();
+        this.snapshotInterval = setInterval(() => this.pollSnapshot(), 2000);
+        this.countdownInterval = setInterval(() => this.tickCountdown(), 1000);
+    }
+
+    pollSnapshot() {
+        fetch('/api/game/snapshot')
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to fetch game snapshot');
+                }
+                const serverDate = Date.parse(response.headers.get('Date'));
+                if (!isNaN(serverDate)) {
+                    this.clockOffset = serverDate - Date.now();
+                }
+                return response.json();
+            })
+            .then(data => this.applySnapshot(data))
+            .catch(error => console.error('Error loading game snapshot:', error));
+    }
+
+    applySnapshot(data) {
+        if (this.socket) return;
+
+        this.gameStatus = data.status;
+        this.isBreakTime = data.is_break;
+        this.deadline = data.deadline ? Date.parse(data.deadline) : null;
+        if (data.timer !== undefined) {
+            this.updateTimer(data.timer, data.is_break);
+        } else {
+            this.tickCountdown();
+        }
+
+        this.setPlayers(data.players);
+        this.updateJoinButton();
+
+        const lastWinnerGame = data.last_winner ? data.last_winner.game_id : null;
+        if (this.lastWinnerGame && lastWinnerGame !== this.lastWinnerGame) {
+            this.showWinnerPopup(data.last_winner);
+        }
+        this.lastWinnerGame = lastWinnerGame;
+
+        // Already playing in this round (e.g. after a reload): go live
+        if (this.userId && data.players.some(player => player.id === this.userId)) {
+            this.connectSocket();
+        }
+    }
+
+    tickCountdown() {
+        if (this.socket || !this.deadline) return;
+        const remaining = Math.max(0, Math.ceil((this.deadline - (Date.now() + this.clockOffset)) / 1000));
+        this.updateTimer(remaining, this.isBreakTime);
+    }
+
+    connectSocket() {
+        if (!this.socket) {
+            clearInterval(this.snapshotInterval);
+            clearInterval(this.countdownInterval);
+            // Ask for packed round events when the decoder is available; the
+            // server still sends JSON if it has packed events switched off
+            const packed = typeof MessagePack !== 'undefined';
+            this.socket = io({ query: packed ? { encoding: 'packed' } : {} });
+            this.setupSocketListeners();
+        }
+        return this.socket;
     }
 
     setupElements() {
@@ -26,10 +93,20 @@ class WheelGame {
         this.statusElement = document.querySelector('.game-status');
         this.timerElement = document.getElementById('countdown');
         this.playersListElement = document.querySelector('.players-list');
+        this.userId = this.wheelContainer.dataset.userId;
         
-        // Initialize grid container
-        this.wheelContainer.innerHTML = '<div class="grid-container"></div>';
-        this.gridContainer = this.wheelContainer.querySelector('.grid-container');
+        // The wheel is drawn on a canvas and spun with a CSS transform, so a
+        // spin costs no script work per frame
+        this.wheelElement = this.wheelContainer.querySelector('.wheel');
+        const size = Math.round((this.wheelContainer.clientWidth || 400) * (window.devicePixelRatio || 1));
+        this.canvas = document.createElement('canvas');
+        this.canvas.className = 'wheel-canvas';
+        this.canvas.width = this.canvas.height = size;
+        this.wheelElement.appendChild(this.canvas);
+
+        // Segments are rendered here once per roster and copied onto the wheel
+        this.segmentsCanvas = document.createElement('canvas');
+        this.segmentsCanvas.width = this.segmentsCanvas.height = size;
         
         if (this.joinButton) {
             this.joinButton.onclick = (e) => {
@@ -78,15 +155,6 @@ class WheelGame {
         }, 5000);
     }
 
-    showExpansionNotice() {
-        this.expansionNotice.textContent = 'Grid expanding...';
-        this.expansionNotice.classList.add('show');
-        
-        setTimeout(() => {
-            this.expansionNotice.classList.remove('show');
-        }, 2000);
-    }
-
     updateTimer(time, isBreak = false) {
         if (!this.timerElement) return;
         
@@ -101,40 +169,88 @@ class WheelGame {
         }
     }
 
-    updateGrid() {
-        // Clear existing cells
-        this.gridContainer.innerHTML = '';
-        
-        // Determine if we need expanded grid (more than 12 players)
-        const needsExpanded = this.players.length > 12;
-        this.gridContainer.classList.toggle('expanded', needsExpanded);
-        
-        // Calculate total cells based on grid type
-        const totalCells = needsExpanded ? 20 : 12; // 5x4 or 4x3
-        const playerPositions = this.getRandomPositions(totalCells, this.players.length);
-        
-        for (let i = 0; i < totalCells; i++) {
-            const cell = document.createElement('div');
-            cell.className = 'grid-cell';
-            
-            const playerIndex = playerPositions.indexOf(i);
-            if (playerIndex !== -1) {
-                const player = this.players[playerIndex];
-                const colorIndex = playerIndex % 12; // We have 12 colors defined in CSS
-                
-                cell.classList.add('occupied');
-                cell.style.setProperty('--player-color', `var(--color-${colorIndex + 1})`);
-                
-                cell.innerHTML = `
-                    <div class="player-emoji">${player.emoji}</div>
-                    <div class="player-name">${player.username}</div>
-                `;
-            }
-            
-            this.gridContainer.appendChild(cell);
+    setPlayers(players) {
+        this.players = players;
+        const rosterKey = players.map(player => player.id).join(',');
+        if (rosterKey === this.rosterKey) return false;
+
+        this.rosterKey = rosterKey;
+        this.renderSegments();
+        this.drawWheel();
+        this.updatePlayersList();
+        return true;
+    }
+
+    segmentPath(ctx, index) {
+        // Segment i spans [i, i + 1) * width clockwise from the pointer at the top
+        // (the same layout spin_plan() in app.py aims at)
+        const radius = this.canvas.width / 2;
+        const width = 2 * Math.PI / this.players.length;
+        const start = index * width - Math.PI / 2;
+        ctx.beginPath();
+        ctx.moveTo(radius, radius);
+        ctx.arc(radius, radius, radius - 4, start, start + width);
+        ctx.closePath();
+        return start + width / 2;
+    }
+
+    renderSegments() {
+        const ctx = this.segmentsCanvas.getContext('2d');
+        const size = this.segmentsCanvas.width;
+        const radius = size / 2;
+        ctx.clearRect(0, 0, size, size);
+
+        if (!this.players.length) {
+            ctx.beginPath();
+            ctx.arc(radius, radius, radius - 4, 0, 2 * Math.PI);
+            ctx.fillStyle = '#f1f2f6';
+            ctx.fill();
+            return;
+        }
+
+        const palette = getComputedStyle(document.documentElement);
+        ctx.font = `bold ${Math.round(radius / 14)}px sans-serif`;
+        ctx.textAlign = 'right';
+        ctx.textBaseline = 'middle';
+        this.players.forEach((player, index) => {
+            const middle = this.segmentPath(ctx, index);
+            ctx.fillStyle = palette.getPropertyValue(`--color-${index % 12 + 1}`).trim() || '#dfe4ea';
+            ctx.fill();
+            ctx.lineWidth = 2;
+            ctx.strokeStyle = '#fff';
+            ctx.stroke();
+
+            ctx.save();
+            ctx.translate(radius, radius);
+            ctx.rotate(middle);
+            ctx.fillStyle = '#333';
+            ctx.fillText(`${player.username} ${player.emoji}`, radius - 16, 0);
+            ctx.restore();
+        });
+    }
+
+    drawWheel(winnerIndex = null) {
+        const ctx = this.canvas.getContext('2d');
+        ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+        ctx.drawImage(this.segmentsCanvas, 0, 0);
+
+        if (winnerIndex !== null && this.players[winnerIndex]) {
+            this.segmentPath(ctx, winnerIndex);
+            ctx.lineWidth = 8;
+            ctx.strokeStyle = '#ffd700';
+            ctx.stroke();
         }
     }
 
+    spinTo(targetAngle, seed) {
+        // Always spin forward; only the angle modulo 360 decides where it stops
+        this.rotation = Math.ceil(this.rotation / 360) * 360 + targetAngle;
+        const duration = 4500 + parseInt(seed.slice(0, 4), 16) % 1500;
+        this.wheelElement.style.transition = `transform ${duration}ms cubic-bezier(0.17, 0.67, 0.12, 0.99)`;
+        this.wheelElement.style.transform = `rotate(${this.rotation}deg)`;
+        return duration;
+    }
+
     updatePlayersList() {
         if (!this.playersListElement) return;
         
@@ -149,18 +265,6 @@ class WheelGame {
         }).join('');
     }
 
-    getRandomPositions(totalCells, playerCount) {
-        const positions = [];
-        for (let i = 0; i < playerCount; i++) {
-            let position;
-            do {
-                position = Math.floor(Math.random() * totalCells);
-            } while (positions.includes(position));
-            positions.push(position);
-        }
-        return positions;
-    }
-
     showNotification(message, type = 'info', duration = 3000) {
         const notification = document.createElement('div');
         notification.className = `game-notification ${type}`;
@@ -177,82 +281,116 @@ class WheelGame {
         }, duration);
     }
 
+    onEvent(event, handler) {
+        this.socket.on(event, (data) => handler(this.decodeEvent(event, data)));
+    }
+
+    decodeEvent(event, data) {
+        // Packed events are msgpack positional arrays (PACKED_EVENTS in app.py)
+        if (!(data instanceof ArrayBuffer)) return data;
+
+        const fields = MessagePack.decode(new Uint8Array(data));
+        const toPlayer = ([id, username, emoji]) => ({ id, username, emoji });
+
+        if (event === 'game_status') {
+            const [status, timer, isBreak, rows] = fields;
+            return { status, timer, isBreak, players: rows.map(toPlayer) };
+        }
+        if (event === 'player_joined') {
+            // Only the new players are sent; they follow the roster we already have.
+            // If we missed an earlier batch there is a gap, and players is null.
+            const [playerCount, rows] = fields;
+            const newPlayers = rows.map(toPlayer);
+            const known = playerCount - newPlayers.length;
+            const players = this.players.length < known
+                ? null
+                : this.players.slice(0, known).concat(newPlayers);
+            return {
+                success: true,
+                message: `${newPlayers.map(player => player.username).join(', ')} joined the game!`,
+                players,
+                player_count: playerCount,
+                new_player: newPlayers[newPlayers.length - 1],
+                new_players: newPlayers
+            };
+        }
+        return fields;
+    }
+
     setupSocketListeners() {
         this.socket.on('connect', () => {
             console.log('Connected to server');
         });
 
-        this.socket.on('game_status', (data) => {
+        this.onEvent('game_status', (data) => {
             this.gameStatus = data.status;
-            this.players = data.players;
             this.isBreakTime = data.isBreak;
             this.updateTimer(data.timer, data.isBreak);
-            this.updateGrid();
-            this.updatePlayersList();
+            this.setPlayers(data.players);
             this.updateJoinButton();
         });
 
-        this.socket.on('player_joined', (data) => {
+        this.onEvent('player_joined', (data) => {
             if (data.success) {
                 this.showNotification(`${data.new_player.emoji} ${data.message}`, 'success');
-                const oldPlayerCount = this.players.length;
-                this.players = data.players;
-                
-                if (oldPlayerCount !== this.players.length) {
-                    this.showExpansionNotice();
+                if (data.players) {
+                    this.setPlayers(data.players);
+                } else {
+                    this.socket.emit('sync_game_status');
                 }
-                
-                this.updateGrid();
-                this.updatePlayersList();
             }
         });
 
-        this.socket.on('winner_selected', (data) => {
-            if (data.winner) {
-                this.showWinnerPopup(data.winner);
-                // Update wallet balance if current user is winner
-                const balanceElement = document.querySelector('.text-center.mb-3 p');
-                if (balanceElement && data.winner.wallet_balance !== undefined) {
-                    balanceElement.textContent = `Your Balance: ₹${data.winner.wallet_balance}`;
+        this.socket.on('join_game_response', (data) => {
+            if (!data.success) {
+                this.showNotification(data.message, 'info');
+                if (this.statusElement) {
+                    this.statusElement.textContent = data.message;
                 }
-                // Schedule page refresh after winner display
-                setTimeout(() => {
-                    window.location.reload();
-                }, 6000); // Refresh 1 second after winner popup disappears
+                this.updateJoinButton();
+            }
+        });
+
+        this.socket.on('notification', (data) => {
+            const type = data.type === 'round_won' || data.type.endsWith('_approved') ? 'success' : 'info';
+            this.showNotification(data.message, type, 5000);
+        });
+
+        this.socket.on('leaderboard_update', (data) => {
+            if (typeof onLeaderboardUpdate === 'function') {
+                onLeaderboardUpdate(data);
             }
         });
 
         this.socket.on('timer', (data) => {
             const timeLeft = data.time;
-            this.updateTimer(timeLeft);
+            this.isBreakTime = !!data.isBreak;
+            this.updateTimer(timeLeft, this.isBreakTime);
             
             // Disable join button in last 10 seconds
-            if (timeLeft <= 10 && this.joinButton) {
+            if (!this.isBreakTime && timeLeft <= 10 && this.joinButton) {
                 this.joinButton.disabled = true;
                 this.joinButton.title = 'Cannot join in last 10 seconds';
             }
         });
 
-        this.socket.on('break_timer', (data) => {
-            this.isBreakTime = true;
-            this.updateJoinButton();
-            setTimeout(() => {
-                this.isBreakTime = false;
-                this.updateJoinButton();
-            }, data.duration * 1000);
-        });
-
         this.socket.on('game_end', (data) => {
             console.log('Game ended:', data);
-            if (data.winner) {
-                const winner = this.players.find(p => p.username === data.winner);
-                if (winner) {
-                    this.announceWinner(winner);
-                }
+            if (data.isBreak) {
+                this.gameStatus = 'break';
+                this.isBreakTime = true;
+                this.updateTimer(data.timer, true);
             }
-            
-            if (this.joinButton) {
-                this.joinButton.disabled = true;
+            this.updateJoinButton();
+            if (data.players) {
+                this.setPlayers(data.players);
+            }
+
+            // Every client runs the same server-chosen spin and stops on the winner
+            const winner = this.players[data.winner_index];
+            if (winner) {
+                const duration = this.spinTo(data.target_angle, data.spin_seed);
+                setTimeout(() => this.announceWinner({ ...winner, prize: data.prize }, data.winner_index), duration);
             }
         });
     }
@@ -272,21 +410,12 @@ class WheelGame {
         }
     }
 
-    announceWinner(winner) {
+    announceWinner(winner, index) {
         // Show winner popup
         this.showWinnerPopup(winner);
 
-        // Remove non-winner cells with animation
-        const playerCells = this.gridContainer.querySelectorAll('.player-cell');
-        playerCells.forEach(cell => {
-            const playerEmoji = cell.querySelector('.player-emoji').textContent;
-            const isWinner = winner.emoji === playerEmoji;
-            if (!isWinner) {
-                cell.classList.add('fade-out');
-            } else {
-                cell.classList.add('winner');
-            }
-        });
+        // Outline the winning segment; the cached segments are reused as-is
+        this.drawWheel(index);
 
         if (this.statusElement) {
             this.statusElement.innerHTML = `
@@ -308,7 +437,8 @@ class WheelGame {
         }
         
         console.log('Attempting to join game...');
-        this.socket.emit('join_game');
+        // Emits are buffered until the socket has connected
+        this.connectSocket().emit('join_game');
     }
 }
 
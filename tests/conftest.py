@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+fakeredis = pytest.importorskip('fakeredis')
+
+from bson import ObjectId
+
+import app as wheel
+
+
+class Clock:
+    def __init__(self):
+        self.current = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+    def now(self):
+        return self.current
+
+    def advance(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+    def past(self, deadline):
+        self.current = wheel.as_utc(deadline) + timedelta(seconds=1)
+
+
+class Engine:
+    """The round engine on in-memory MongoDB and Redis, driven by a fake clock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def create_users(self, count, balance=100):
+        ids = [ObjectId() for _ in range(count)]
+        wheel.db.users.insert_many([
+            {'_id': user_id, 'username': f"user{i}",
+             'user_data': {'username': f"user{i}", 'wallet_balance': balance, 'emoji': '🎮'}}
+            for i, user_id in enumerate(ids)
+        ])
+        return ids
+
+    def join(self, *user_ids):
+        for user_id in user_ids:
+            wheel.join_queue.submit(f"sid-{user_id}", {'id': str(user_id), 'username': 'player', 'emoji': '🎮'})
+        wheel.join_queue.drain()
+
+    def state(self):
+        return wheel.game_state.get_game_state()
+
+    def balance(self, user_id):
+        return wheel.db.users.find_one({'_id': user_id})['user_data']['wallet_balance']
+
+    def total_balance(self, user_ids):
+        return sum(self.balance(user_id) for user_id in user_ids)
+
+    def kill(self):
+        """Lose everything the engine process held: only MongoDB survives."""
+        wheel.redis_game.delete(wheel.game_state.game_key)
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    wheel.create_app({'REDIS_HOST': None, 'SOCKETIO_MESSAGE_QUEUE': None, 'MONGO_DB': 'wheel_test'})
+    monkeypatch.setitem(wheel.app.config, 'REDIS_HOST', 'memory')
+    wheel.connections.use_clients(mongo=mongomock.MongoClient(), redis_client=fakeredis.FakeRedis())
+
+    monkeypatch.setattr(wheel.join_queue, 'background', False)
+    monkeypatch.setattr(wheel.join_queue, '_pending', [])
+    monkeypatch.setattr(wheel.notification_outbox, 'background', False)
+    monkeypatch.setattr(wheel.notification_outbox, '_pending', [])
+
+    clock = Clock()
+    monkeypatch.setattr(wheel, 'utcnow', clock.now)
+
+    with wheel.app.app_context():
+        wheel.tick_round()  # Opens the first round
+        yield Engine(clock)
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+from bson import ObjectId
+
+import app as wheel
+
+
+def insert_games(day, count):
+    wheel.db.games.insert_many([
+        {'_id': ObjectId(), 'game_id': f"round-{day.day}-{i}", 'timestamp': day + timedelta(hours=i),
+         'participants': [], 'participant_count': 2, 'total_pool': 20, 'winner_prize': 16,
+         'platform_fee': 4, 'winner': {'id': None, 'username': 'player', 'emoji': None},
+         'status': 'completed'}
+        for i in range(count)
+    ])
+
+
+def test_interrupted_archive_counts_each_game_once(engine, monkeypatch):
+    first_day = datetime(2023, 11, 1, tzinfo=timezone.utc)
+    second_day = first_day + timedelta(days=1)
+    insert_games(first_day, 2)
+    insert_games(second_day, 3)
+
+    # The run stops after writing the second day's chunk, before deleting its games
+    delete_many = mongomock.collection.Collection.delete_many
+    calls = []
+
+    def interrupted(collection, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("worker killed")
+        return delete_many(collection, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'delete_many', interrupted)
+    try:
+        wheel.archive_games(batch_size=3)
+    except RuntimeError:
+        pass
+    assert wheel.archive_games(batch_size=3) == 3
+
+    counts = {day['_id']: (day['game_count'], [chunk['count'] for chunk in day['chunks']])
+              for day in wheel.db.games_archive.find()}
+    assert counts == {'2023-11-01': (2, [2]), '2023-11-02': (3, [3])}
+    assert wheel.db.games.count_documents({}) == 0
+
+
+def test_days_larger_than_a_batch_are_split_into_chunks(engine):
+    insert_games(datetime(2023, 11, 1, tzinfo=timezone.utc), 5)
+
+    assert wheel.archive_games(batch_size=2) == 5
+
+    summary, games = wheel.load_archived_games('2023-11-01')
+    assert summary['game_count'] == 5 and len(games) == 5
+    assert [chunk['count'] for chunk in summary['chunks']] == [2, 2, 1]
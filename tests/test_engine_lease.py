@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta, timezone
+
+import app as wheel
+
+
+def test_only_one_worker_holds_the_lease(engine):
+    first, second = wheel.EngineLease(), wheel.EngineLease()
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert first.acquire()  # Renewal by the holder
+
+
+def test_lease_falls_back_to_mongodb_without_redis(engine, monkeypatch):
+    monkeypatch.setitem(wheel.app.config, 'REDIS_HOST', None)
+    first, second = wheel.EngineLease(), wheel.EngineLease()
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert first.acquire()
+
+    # A holder that stops renewing loses the lease once it expires
+    wheel.db.leases.update_one({'_id': first.key},
+                               {'$set': {'expires_at': datetime.now(timezone.utc) - timedelta(seconds=1)}})
+    assert second.acquire()
+    assert not first.acquire()
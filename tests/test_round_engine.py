@@ -0,0 +1,210 @@
+import pytest
+
+import app as wheel
+
+
+def test_round_settles_at_deadline(engine):
+    users = engine.create_users(3)
+    engine.join(*users)
+    assert engine.total_balance(users) == 270
+
+    engine.clock.past(engine.state()['ends_at'])
+    wheel.tick_round()
+
+    assert engine.state()['is_break']
+    assert sorted(engine.balance(user) for user in users) == [90, 90, 114]
+    assert wheel.db.games.count_documents({}) == 1
+
+
+def test_single_player_is_refunded(engine):
+    [user] = engine.create_users(1)
+    engine.join(user)
+
+    engine.clock.past(engine.state()['ends_at'])
+    wheel.tick_round()
+
+    assert engine.state()['is_break']
+    assert engine.balance(user) == 100
+    assert wheel.db.games.count_documents({}) == 0
+
+
+def test_break_ends_with_a_new_round(engine):
+    users = engine.create_users(2)
+    engine.join(*users)
+    engine.clock.past(engine.state()['ends_at'])
+    wheel.tick_round()
+    finished = engine.state()['game_id']
+
+    engine.clock.past(engine.state()['break_ends_at'])
+    wheel.tick_round()
+
+    state = engine.state()
+    assert state['status'] == 'joining' and not state['is_break']
+    assert state['game_id'] != finished and state['players'] == []
+
+
+def test_killed_before_deadline_resumes_round(engine):
+    users = engine.create_users(2)
+    engine.join(*users)
+    round_id = engine.state()['game_id']
+
+    engine.kill()
+    assert wheel.recover_round() == 'resumed'
+
+    state = engine.state()
+    assert state['game_id'] == round_id and len(state['players']) == 2
+    assert engine.total_balance(users) == 180
+
+
+def test_killed_through_deadline_settles_once_on_recovery(engine):
+    users = engine.create_users(3)
+    engine.join(*users)
+
+    engine.clock.past(engine.state()['ends_at'])
+    engine.kill()
+    assert wheel.recover_round() == 'settled'
+    assert engine.total_balance(users) == 294
+
+    # A second restart finds the break and pays nothing more
+    engine.kill()
+    assert wheel.recover_round() == 'break'
+    assert engine.total_balance(users) == 294
+
+
+def test_killed_between_payout_and_break_pays_once(engine):
+    users = engine.create_users(3)
+    engine.join(*users)
+
+    engine.clock.past(engine.state()['ends_at'])
+    wheel.settle_round(engine.state())  # Paid out, then the process died
+    engine.kill()
+
+    assert wheel.recover_round() == 'settled'
+    assert engine.total_balance(users) == 294
+    assert wheel.db.games.count_documents({}) == 1
+    assert engine.state()['is_break']
+
+
+def test_killed_between_refund_and_break_refunds_once(engine):
+    [user] = engine.create_users(1)
+    engine.join(user)
+
+    engine.clock.past(engine.state()['ends_at'])
+    wheel.settle_round(engine.state())
+    engine.kill()
+
+    assert wheel.recover_round() == 'refunded'
+    assert engine.balance(user) == 100
+
+
+@pytest.mark.parametrize('failing', ['backfill_user_stats', 'compact_game'])
+def test_failed_settlement_is_retried(engine, monkeypatch, failing):
+    # backfill_user_stats fails before anything is paid, compact_game after the payout
+    users = engine.create_users(3)
+    engine.join(*users)
+    original = getattr(wheel, failing)
+
+    def fail(*args, **kwargs):
+        monkeypatch.setattr(wheel, failing, original)
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(wheel, failing, fail)
+    round_id = engine.state()['game_id']
+    engine.clock.past(engine.state()['ends_at'])
+    with pytest.raises(RuntimeError):
+        wheel.tick_round()
+
+    state = engine.state()
+    assert not state.get('is_break') and state['status'] == 'running'
+
+    wheel.tick_round()
+    assert engine.state()['is_break']
+    assert engine.total_balance(users) == 294
+
+    # The retry also ran what the failed settlement never got to, exactly once
+    kinds = [event['type'] for event in wheel.round_events.replay(round_id)]
+    assert kinds.count('winner') == 1 and kinds.count('payout') == 1
+    [leader] = wheel.leaderboard.top('winnings', 'all')
+    assert leader['score'] == 24
+    assert len(wheel.notification_outbox._pending) == 3
+
+
+def test_break_without_deadline_does_not_stall(engine):
+    wheel.game_state.update_game_state({'status': 'break', 'is_break': True, 'break_ends_at': None})
+    stalled = engine.state()['game_id']
+
+    wheel.tick_round()
+
+    state = engine.state()
+    assert state['game_id'] != stalled and not state['is_break']
+
+
+def test_joins_close_before_deadline(engine):
+    users = engine.create_users(2)
+    engine.join(users[0])
+
+    engine.clock.current = wheel.as_utc(engine.state()['ends_at'])
+    engine.clock.advance(-wheel.JOIN_CUTOFF_SECONDS)
+    wheel.tick_round()
+    engine.join(users[1])
+
+    assert [player['id'] for player in engine.state()['players']] == [str(users[0])]
+    assert engine.balance(users[1]) == 100
+
+
+def test_join_after_deadline_is_refunded(engine):
+    users = engine.create_users(2)
+    engine.join(users[0])
+
+    # The deadline passed but no tick has closed the round yet
+    engine.clock.past(engine.state()['ends_at'])
+    engine.join(users[1])
+
+    assert [player['id'] for player in engine.state()['players']] == [str(users[0])]
+    assert engine.balance(users[1]) == 100
+    assert wheel.db.users.find_one({'_id': users[1]}).get('last_joined_game') is None
+
+
+def test_settlement_uses_stored_roster(engine):
+    users = engine.create_users(2)
+    engine.join(users[0])
+    snapshot = engine.state()
+
+    # Lands after the tick read its snapshot but before it settled
+    engine.join(users[1])
+    engine.clock.past(snapshot['ends_at'])
+    wheel.finish_round(snapshot)
+
+    assert wheel.db.games.find_one()['participant_count'] == 2
+    assert engine.total_balance(users) == 196
+
+
+def test_two_queues_draining_the_same_user(engine, monkeypatch):
+    users = engine.create_users(3)
+    snapshot = engine.state()
+    # Both workers read the round before either one pushed
+    monkeypatch.setattr(wheel.game_state, 'get_game_state', lambda: dict(snapshot))
+
+    first, second = wheel.JoinQueue(), wheel.JoinQueue()
+    for queue, joining in ((first, users[:2]), (second, users[1:])):
+        queue.background = False
+        for user_id in joining:
+            queue.submit(f"sid-{user_id}", {'id': str(user_id), 'username': 'player', 'emoji': '🎮'})
+    first.drain()
+    second.drain()
+    monkeypatch.undo()
+
+    roster = [player['id'] for player in engine.state()['players']]
+    assert roster == [str(user_id) for user_id in users]
+    assert [engine.balance(user_id) for user_id in users] == [90, 90, 90]
+
+
+def test_add_players_skips_players_already_on_roster(engine):
+    users = engine.create_users(2)
+    engine.join(users[0])
+    round_id = engine.state()['game_id']
+
+    players = [{'id': str(user_id), 'username': 'player', 'emoji': '🎮'} for user_id in users]
+    updated = wheel.game_state.add_players(round_id, players)
+
+    assert [player['id'] for player in updated['players']] == [str(user_id) for user_id in users]
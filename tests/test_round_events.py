@@ -0,0 +1,35 @@
+import mongomock
+
+import app as wheel
+
+
+def test_append_many_reserves_consecutive_sequence_numbers(engine):
+    before = wheel.round_events.append('phase', 'round-1', phase='running')
+    events = wheel.round_events.append_many([
+        ('winner', 'round-1', {'user_id': 'a'}),
+        ('payout', 'round-1', {'user_id': 'a', 'amount': 16})
+    ])
+    after = wheel.round_events.append('phase', 'round-1', phase='break')
+
+    assert [event['seq'] for event in events] == [before['seq'] + 1, before['seq'] + 2]
+    assert after['seq'] == before['seq'] + 3
+    assert [event['type'] for event in wheel.round_events.replay('round-1')] == ['phase', 'winner', 'payout', 'phase']
+
+
+def test_join_batch_takes_one_counter_write(engine, monkeypatch):
+    users = engine.create_users(5)
+    find_one_and_update = mongomock.collection.Collection.find_one_and_update
+    counter_writes = []
+
+    def counted(collection, *args, **kwargs):
+        if collection.name == 'counters':
+            counter_writes.append(args)
+        return find_one_and_update(collection, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'find_one_and_update', counted)
+    engine.join(*users)
+
+    assert len(counter_writes) == 1
+    joined = [event for event in wheel.round_events.replay(engine.state()['game_id'])
+              if event['type'] == 'player_joined']
+    assert [event['data']['user_id'] for event in joined] == [str(user_id) for user_id in users]
@@ -0,0 +1,20 @@
+import pytest
+
+import app as wheel
+
+
+@pytest.mark.parametrize('player_count', [2, 3, 5, 7, 12, 20])
+def test_target_angle_lands_in_winner_segment(player_count):
+    players = [{'id': f"player{i}", 'username': f"player{i}", 'emoji': '🎮'} for i in range(player_count)]
+    segment = 360 / player_count
+
+    for round_number in range(25):
+        game_data = {'game_id': f"round-{player_count}-{round_number}", 'players': players}
+        for index, winner in enumerate(players):
+            plan = wheel.spin_plan(game_data, winner)
+            # The client draws segment i over [i, i + 1) * segment clockwise from
+            # the pointer, so a clockwise turn by target_angle stops here
+            landed = (360 - plan['target_angle'] % 360) % 360
+
+            assert plan['winner_index'] == index
+            assert index * segment <= landed < (index + 1) * segment
@@ -0,0 +1,30 @@
+from bson import ObjectId
+
+import app as wheel
+
+
+def test_counters_match_history_after_settlement_and_refund(engine):
+    users = engine.create_users(3)
+    # Played before the counters existed: history but no stats document
+    wheel.db.users.update_one({'_id': users[0]}, {'$set': {'game_history': [
+        {'game_id': ObjectId(), 'won': True, 'prize_pool': 30},
+        {'game_id': ObjectId(), 'won': False, 'prize_pool': 20}
+    ]}})
+
+    engine.join(*users)
+    engine.clock.past(engine.state()['ends_at'])
+    wheel.tick_round()
+    engine.clock.past(engine.state()['break_ends_at'])
+    wheel.tick_round()
+
+    engine.join(users[1])
+    engine.clock.past(engine.state()['ends_at'])
+    wheel.tick_round()
+    assert engine.balance(users[1]) in (90, 114)
+
+    result = wheel.app.test_cli_runner().invoke(args=['check-user-stats'])
+    assert result.output.strip() == "0 users with mismatched counters"
+
+    stats = wheel.db.users.find_one({'_id': users[0]})['stats']
+    assert stats['games_played'] == 3
+    assert wheel.db.users.find_one({'_id': users[1]})['stats']['refunds'] == 10